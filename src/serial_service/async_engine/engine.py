@@ -0,0 +1,268 @@
+import asyncio
+import json
+import logging
+import time
+
+import paho.mqtt.client as mqtt
+
+from async_engine.modbus import AsyncSerialTransport, AsyncModbusClient
+from async_engine.mqtt import AsyncioMqttHelper
+from sensors_handler.sensor import Sensor as PressureSensor
+from sensors_handler.flow_sensor import Sensor as FlowSensor
+from serial_com.scheduler import Priority
+from serial_com.serial_com import DEFAULT_BUS, resolve_bus
+from vfd_handler.vfd_node import VFDController
+from sensors_handler.publisher import TelemetryPublisher
+from telemetry_codec import encode_value
+
+
+class AsyncSerialService:
+    """
+    Single event loop version of serial_service: sensor pollers, VFD command handlers,
+    VFD feedback and MQTT all run as coroutines over one non-blocking transport per bus.
+    """
+
+    def __init__(self, config_file):
+        self.logger = self.setup_logger()
+        with open(config_file) as f:
+            config = json.load(f)
+        self.device_id = config["device_id"]
+        self.mqtt_config = config["mqtt"]
+        self.vfd_address = int(config["vfd"]["address"])
+        self.diagnostics_interval = config["serial"].get("diagnostics_interval", 10)
+        telemetry = config.get("telemetry", {})
+        self.frames = telemetry.get("frames", False)
+        self.frame_rate = telemetry.get("frame_rate", 50)
+        self.binary = telemetry.get("encoding", "json") == "binary"
+        # One transport and one worker per bus, buses run independently of each other
+        bus_configs = {DEFAULT_BUS: config["serial"]}
+        for name, bus_config in config.get("buses", {}).items():
+            if name != DEFAULT_BUS:
+                bus_configs[name] = {**config["serial"], **bus_config}
+        self.buses = {
+            name: AsyncModbusClient(
+                AsyncSerialTransport(bus_config, self.logger), self.logger, bus_config.get("circuit_breaker")
+            )
+            for name, bus_config in bus_configs.items()
+        }
+        self.modbus = resolve_bus(self.buses, config["vfd"].get("bus", DEFAULT_BUS))
+        self.sensors = []
+        for sensor_config in config["sensors"]:
+            if not sensor_config.get("active", True):
+                continue
+            modbus = resolve_bus(self.buses, sensor_config.get("bus", DEFAULT_BUS))
+            if sensor_config["type"] == "pressure":
+                self.sensors.append(PressureSensor(sensor_config, serial_com=modbus))
+            elif sensor_config["type"] == "flow":
+                self.sensors.append(FlowSensor(sensor_config, serial_com=modbus))
+        self.sensor_topics = {}
+        for sensor in self.sensors:
+            if hasattr(sensor, "subscriptions"):
+                for topic in sensor.subscriptions(self.device_id):
+                    self.sensor_topics.setdefault(topic, []).append(sensor)
+        self.missed = {sensor.name: 0 for sensor in self.sensors}
+        self.mqtt_connected = False
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.publisher = TelemetryPublisher(self.client, self.device_id, self.binary, self.frames, self.logger)
+        self.loop = None
+
+    def setup_logger(self):
+        logger = logging.getLogger(self.__class__.__name__)
+        logger.setLevel(logging.INFO)
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        ch = logging.StreamHandler()
+        ch.setFormatter(formatter)
+        logger.addHandler(ch)
+        return logger
+
+    async def connect_mqtt(self):
+        self.client.on_connect = self.on_mqtt_connect
+        self.client.on_disconnect = self.on_mqtt_disconnect
+        self.client.on_message = self.on_mqtt_message
+        if self.mqtt_config["username"] and self.mqtt_config["password"]:
+            self.client.username_pw_set(self.mqtt_config["username"], self.mqtt_config["password"])
+        AsyncioMqttHelper(self.loop, self.client)
+        while True:
+            try:
+                self.client.connect(self.mqtt_config["broker_host"], self.mqtt_config["broker_port"], 60)
+                break
+            except Exception as e:
+                self.logger.error(f"Failed to connect to MQTT broker: {e}")
+                await asyncio.sleep(5)
+
+    def on_mqtt_connect(self, client, userdata, flags, rc, prop):
+        if rc == 0:
+            self.logger.info("Connected to MQTT broker")
+            self.mqtt_connected = True
+            client.subscribe(f"{self.device_id}/vfd/command")
+            for topic in self.sensor_topics:
+                client.subscribe(topic)
+        else:
+            self.logger.error("Failed to connect to MQTT broker")
+
+    def on_mqtt_disconnect(self, client, userdata, flags, rc, prop):
+        self.logger.warning("Disconnected from MQTT broker")
+        self.mqtt_connected = False
+        self.loop.create_task(self.reconnect_mqtt())
+
+    async def reconnect_mqtt(self):
+        while not self.mqtt_connected:
+            try:
+                self.client.reconnect()
+                return
+            except Exception as e:
+                self.logger.error(f"Failed to reconnect to MQTT broker: {e}")
+                await asyncio.sleep(5)
+
+    def on_mqtt_message(self, client, userdata, msg):
+        if msg.topic in self.sensor_topics:
+            for sensor in self.sensor_topics[msg.topic]:
+                try:
+                    sensor.on_message(msg.topic, msg.payload)
+                except Exception as e:
+                    self.logger.error(f"Error processing {msg.topic} for {sensor.name}: {e}")
+            return
+        try:
+            message = json.loads(msg.payload.decode())
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Error decoding JSON message: {e}")
+            return
+        self.loop.create_task(self.handle_vfd_command(message.get("command"), message.get("parameter")))
+
+    async def handle_vfd_command(self, command, parameter):
+        vfd = VFDController
+        try:
+            if command == "start":
+                await self.modbus.write_register(self.vfd_address, vfd.startstopAddr, vfd.startCmd, vfd.startDec)
+                self.logger.info("Started VFD.")
+            elif command == "stop":
+                await self.modbus.write_register(self.vfd_address, vfd.startstopAddr, vfd.stopCmd, vfd.startDec)
+                self.logger.info("Stopped VFD.")
+            elif command == "set_frequency":
+                if parameter is None:
+                    self.logger.error("Error: No frequency parameter provided.")
+                    return
+                frequency = float(parameter)
+                await self.modbus.write_register(self.vfd_address, vfd.setFreqAddr, frequency, vfd.setFreqDec)
+                self.logger.info(f"Set frequency: {frequency}")
+            elif command == "emergency_stop":
+                await self.emergency_stop()
+            else:
+                self.logger.error(f"Unknown command: {command}")
+        except Exception as e:
+            self.logger.error(f"Ignored writing command: {e}")
+
+    async def emergency_stop(self):
+        vfd = VFDController
+        try:
+            await self.modbus.write_register(
+                self.vfd_address, vfd.startstopAddr, vfd.stopCmd, vfd.startDec, priority=Priority.EMERGENCY_STOP
+            )
+        except Exception as e:
+            self.logger.error(f"Ignored writing command: {e}")
+        while True:
+            try:
+                speed = await self.modbus.read_register(
+                    self.vfd_address, vfd.readFreqAddr, 2, priority=Priority.EMERGENCY_STOP
+                )
+                if speed == 0:
+                    break
+                self.logger.error(f"Waiting for VFD to respond, current speed is {speed}")
+            except Exception as e:
+                self.logger.error(f"Ignored reading command: {e}")
+            await asyncio.sleep(0.1)
+        self.logger.info("Emergency stop executed.")
+
+    async def publish_vfd_feedback(self):
+        while True:
+            try:
+                speed = await self.modbus.read_register(
+                    self.vfd_address, VFDController.readFreqAddr, 2, priority=Priority.VFD_FEEDBACK
+                )
+                if self.mqtt_connected:
+                    self.client.publish(f"{self.device_id}/vfd/feedback", encode_value(speed, self.binary))
+            except Exception as e:
+                self.logger.error(f"Failed to read VFD feedback: {e}")
+            await asyncio.sleep(1)
+
+    async def poll_sensor(self, sensor, offset: float):
+        """Polls one sensor at its configured frequency on absolute deadlines."""
+        period = 1.0 / sensor.frequency
+        deadline = self.loop.time() + offset
+        while True:
+            delay = deadline - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                sensor.last_t = sensor.sample(await sensor.serial_com.read_map(sensor.address))
+                sensor.read_succeeded()
+            except Exception:
+                sensor.read_failed()
+            polled = time.time()
+            if self.mqtt_connected:
+                self.publisher.publish_availability(sensor)
+                sensor.samples += 1
+                value = int(sensor.last_t * 100) / 100
+                if not sensor.samples % sensor.publish_every and sensor.deadband.due(value, sensor.quality):
+                    self.publisher.publish(sensor, value, polled)
+            deadline += period
+            now = self.loop.time()
+            if now > deadline:
+                self.missed[sensor.name] += 1
+                deadline = now
+
+    async def publish_frames(self):
+        """Publishes the readings collected during each frame period as one frame."""
+        period = 1.0 / self.frame_rate
+        deadline = self.loop.time()
+        while True:
+            deadline += period
+            delay = deadline - self.loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                deadline = self.loop.time()
+            frame = self.publisher.take_frame()
+            if frame is None or not self.mqtt_connected:
+                continue
+            self.publisher.publish_frame(frame)
+
+    async def publish_diagnostics(self):
+        while True:
+            await asyncio.sleep(self.diagnostics_interval)
+            diagnostics = {name: modbus.stats.take() for name, modbus in self.buses.items()}
+            if self.mqtt_connected:
+                self.client.publish(f"{self.device_id}/diagnostics/serial", json.dumps(diagnostics))
+
+    async def report_missed(self, interval: float = 10):
+        while True:
+            await asyncio.sleep(interval)
+            missed = {name: count for name, count in self.missed.items() if count}
+            if missed:
+                summary = ", ".join(f"{name}: {count}" for name, count in missed.items())
+                self.logger.warning(f"Missed polling deadlines in the last {interval}s ({summary})")
+                for name in missed:
+                    self.missed[name] = 0
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        await self.connect_mqtt()
+        tasks = []
+        for modbus in self.buses.values():
+            modbus.start()
+            tasks.append(self.loop.create_task(modbus.run()))
+        tasks.append(self.loop.create_task(self.publish_vfd_feedback()))
+        tasks.append(self.loop.create_task(self.report_missed()))
+        tasks.append(self.loop.create_task(self.publish_diagnostics()))
+        if self.frames:
+            tasks.append(self.loop.create_task(self.publish_frames()))
+        for index, sensor in enumerate(self.sensors):
+            offset = index / len(self.sensors) / sensor.frequency
+            tasks.append(self.loop.create_task(self.poll_sensor(sensor, offset)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.client is not None:
+                self.client.disconnect()
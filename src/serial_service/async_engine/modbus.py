@@ -0,0 +1,213 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import minimalmodbus
+import serial
+
+from async_engine import rtu
+from serial_com.register_map import RegisterMap
+from serial_com.scheduler import Priority
+from serial_com.circuit_breaker import CircuitBreaker, GUARDED_PRIORITIES
+from serial_com.trace import Outcome, classify
+from serial_com.stats import BusStatistics
+
+
+class AsyncSerialTransport:
+    """
+    Non-blocking RTU transport: the port is opened with timeout=0 and its file
+    descriptor is watched by the event loop, so waiting for a reply never blocks.
+    """
+
+    def __init__(self, config, logger: logging.Logger):
+        self.port = config["port"]
+        self.baudrate = config["baudrate"]
+        self.bytesize = config["bytesize"]
+        self.parity = getattr(serial, config["parity"])
+        self.stopbits = config["stopbits"]
+        self.timeout = config["timeout"]
+        self.logger = logger
+        # Character time for 11 bit frames, RTU asks for 3.5 characters of silence between frames
+        self.char_time = 11.0 / self.baudrate
+        self.silence = max(3.5 * self.char_time, 0.00175)
+        self.serial = None
+        self.buffer = bytearray()
+        self.waiter = None
+        self.silent_until = 0.0
+
+    def open(self):
+        self.serial = serial.Serial(
+            self.port,
+            baudrate=self.baudrate,
+            bytesize=self.bytesize,
+            parity=self.parity,
+            stopbits=self.stopbits,
+            timeout=0,
+        )
+        asyncio.get_running_loop().add_reader(self.serial.fileno(), self._on_readable)
+
+    def close(self):
+        if self.serial is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self.serial.fileno())
+            except (RuntimeError, ValueError, OSError):
+                pass
+            self.serial.close()
+            self.serial = None
+
+    def _on_readable(self):
+        try:
+            self.buffer += self.serial.read(self.serial.in_waiting or 1)
+        except (serial.SerialException, OSError) as e:
+            self.logger.error(f"Read error on {self.port}: {e}")
+        self._wake()
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def transact(self, request: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        wait = self.silent_until - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.buffer.clear()
+        self.serial.write(request)
+        # Reply window starts once the request has left the wire
+        deadline = loop.time() + len(request) * self.char_time + self.timeout
+        try:
+            while True:
+                length = rtu.expected_length(request, self.buffer)
+                if length and len(self.buffer) >= length:
+                    return rtu.parse_response(request, bytes(self.buffer[:length]))
+                if loop.time() >= deadline:
+                    if self.buffer:
+                        raise minimalmodbus.InvalidResponseError(
+                            f"Incomplete response from address {request[0]}: {self.buffer.hex()}"
+                        )
+                    raise minimalmodbus.NoResponseError(f"No response from address {request[0]}")
+                self.waiter = loop.create_future()
+                timer = loop.call_at(deadline, self._wake)
+                try:
+                    await self.waiter
+                finally:
+                    timer.cancel()
+                    self.waiter = None
+        finally:
+            self.silent_until = loop.time() + self.silence
+
+
+class AsyncModbusClient:
+    """
+    Coroutine counterpart of SerialCom. Requests are queued by Priority and a single
+    worker task puts them on the wire one at a time, most urgent first.
+    """
+
+    def __init__(self, transport: AsyncSerialTransport, logger: logging.Logger, breaker_config: dict = None):
+        self.transport = transport
+        self.logger = logger
+        self.breaker_config = breaker_config or {}
+        self.breakers = {}
+        self.stats = BusStatistics()
+        self.register_maps = {}
+        self.queue = None
+        self.seq = itertools.count()
+        self.transactions = 0
+
+    def declare_registers(self, address: int, register_map: RegisterMap):
+        if register_map.count > 125:
+            raise ValueError(f"Register map for address {address} spans {register_map.count} registers, more than one read allows")
+        self.register_maps[address] = register_map
+
+    def start(self):
+        """Opens the port and creates the request queue, from inside the running loop."""
+        self.queue = asyncio.PriorityQueue()
+        self.transport.open()
+
+    async def run(self):
+        try:
+            while True:
+                _, _, request, future = await self.queue.get()
+                if future.cancelled():
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = await self.transport.transact(request)
+                    self.transactions += 1
+                    self.stats.record(request[0], request[1], time.perf_counter() - start, Outcome.OK)
+                    future.set_result(result)
+                except minimalmodbus.ModbusException as e:
+                    self.stats.record(request[0], request[1], time.perf_counter() - start, classify(e))
+                    future.set_exception(e)
+                except (serial.SerialException, OSError) as e:
+                    self.stats.record(request[0], request[1], time.perf_counter() - start, classify(e))
+                    future.set_exception(e)
+                    self.logger.error(f"Serial error, reopening {self.transport.port}: {e}")
+                    self.transport.close()
+                    await asyncio.sleep(1)
+                    self._reopen()
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+        finally:
+            self.transport.close()
+
+    def _reopen(self):
+        try:
+            self.transport.open()
+        except (serial.SerialException, OSError) as e:
+            self.logger.error(f"Failed to reopen {self.transport.port}: {e}")
+
+    def breaker(self, address: int) -> CircuitBreaker:
+        if address not in self.breakers:
+            self.breakers[address] = CircuitBreaker(
+                address,
+                failure_threshold=self.breaker_config.get("failure_threshold", 3),
+                min_backoff=self.breaker_config.get("min_backoff", 1.0),
+                max_backoff=self.breaker_config.get("max_backoff", 60.0),
+            )
+        return self.breakers[address]
+
+    def is_available(self, address: int) -> bool:
+        return self.breaker(address).available
+
+    async def _submit(self, request: bytes, priority: Priority) -> bytes:
+        breaker = self.breaker(request[0])
+        if priority in GUARDED_PRIORITIES:
+            breaker.before_call()
+        try:
+            result = await self._enqueue(request, priority)
+        except Exception as e:
+            if breaker.record(classify(e)):
+                self.logger.warning(f"Circuit breaker for address {request[0]} is now {breaker.state}")
+            raise
+        if breaker.record(Outcome.OK):
+            self.logger.warning(f"Circuit breaker for address {request[0]} is now {breaker.state}")
+        return result
+
+    async def _enqueue(self, request: bytes, priority: Priority) -> bytes:
+        if self.transport.serial is None:
+            self._reopen()
+            if self.transport.serial is None:
+                raise serial.SerialException(f"Port {self.transport.port} is not open")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((int(priority), next(self.seq), request, future))
+        return await future
+
+    async def read_block(self, address: int, register: int, number_of_registers: int, priority: Priority = Priority.SENSOR_POLL):
+        data = await self._submit(rtu.read_registers_request(address, register, number_of_registers), priority)
+        return rtu.decode_registers(data)
+
+    async def read_map(self, address: int, priority: Priority = Priority.SENSOR_POLL) -> dict:
+        register_map = self.register_maps[address]
+        registers = await self.read_block(address, register_map.start, register_map.count, priority)
+        return register_map.decode(registers)
+
+    async def read_register(self, address: int, register: int, number_of_decimals: int = 0, priority: Priority = Priority.SENSOR_POLL):
+        value = (await self.read_block(address, register, 1, priority))[0]
+        return value / 10 ** number_of_decimals if number_of_decimals else value
+
+    async def write_register(self, address: int, register: int, value, number_of_decimals: int = 0, priority: Priority = Priority.VFD_CONTROL):
+        raw = int(round(value * 10 ** number_of_decimals))
+        await self._submit(rtu.write_register_request(address, register, raw), priority)
@@ -0,0 +1,73 @@
+import struct
+
+import minimalmodbus
+
+
+def crc16(data: bytes) -> int:
+    """Modbus RTU CRC (polynomial 0xA001, initial value 0xFFFF)."""
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc >>= 1
+    return crc
+
+
+def frame(address: int, functioncode: int, payload: bytes) -> bytes:
+    body = bytes([address, functioncode]) + payload
+    return body + struct.pack("<H", crc16(body))
+
+
+def read_registers_request(address: int, register: int, count: int, functioncode: int = 3) -> bytes:
+    return frame(address, functioncode, struct.pack(">HH", register, count))
+
+
+def write_register_request(address: int, register: int, value: int) -> bytes:
+    return frame(address, 6, struct.pack(">HH", register, value & 0xFFFF))
+
+
+def expected_length(request: bytes, buffer: bytes) -> int:
+    """
+    Length of the complete response to request, or 0 while the buffer is too short to tell.
+    """
+    if len(buffer) < 2:
+        return 0
+    if buffer[1] & 0x80:
+        return 5
+    functioncode = request[1]
+    if functioncode in (3, 4):
+        if len(buffer) < 3:
+            return 0
+        return 5 + buffer[2]
+    # Function codes 6 and 16 echo address, register and value/count
+    return 8
+
+
+def parse_response(request: bytes, response: bytes) -> bytes:
+    """Validates a response against its request and returns the data part."""
+    if struct.unpack("<H", response[-2:])[0] != crc16(response[:-2]):
+        raise minimalmodbus.InvalidResponseError(f"CRC mismatch in response {response.hex()}")
+    if response[0] != request[0]:
+        raise minimalmodbus.InvalidResponseError(
+            f"Response from address {response[0]}, expected {request[0]}"
+        )
+    if response[1] == request[1] | 0x80:
+        raise minimalmodbus.SlaveReportedException(
+            f"Slave {request[0]} reported exception code {response[2]}"
+        )
+    if response[1] != request[1]:
+        raise minimalmodbus.InvalidResponseError(
+            f"Response function code {response[1]}, expected {request[1]}"
+        )
+    if request[1] in (3, 4):
+        return response[3:-2]
+    if response[2:-2] != request[2:6]:
+        raise minimalmodbus.InvalidResponseError(f"Write echo mismatch in response {response.hex()}")
+    return response[2:-2]
+
+
+def decode_registers(data: bytes):
+    return list(struct.unpack(f">{len(data) // 2}H", data))
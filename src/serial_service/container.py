@@ -7,8 +7,12 @@ print(f"Current working directory: {current_dir}")
 from vfd_handler.vfd_node import VFDController
 from sensors_handler.sensor_node import SensorHandler
 from serial_com.serial_com import SerialCom
+from async_engine.engine import AsyncSerialService
 import logging
 import threading
+import json
+import asyncio
+import signal
 
 def run_vfd_controller(vfd_controller):
     """Runs the VFD controller in a separate thread."""
@@ -18,11 +22,26 @@ def run_sensor_handler(sensor_handler):
     """Runs the sensor handler in a separate thread."""
     sensor_handler.run()
 
+def run_async_engine(config_file):
+    """Runs the whole service on one asyncio event loop."""
+    try:
+        asyncio.run(AsyncSerialService(config_file).run())
+    except KeyboardInterrupt:
+        logging.info("\nKeyboardInterrupt: Stopping...")
+
 if __name__ == "__main__":
     config_file = "config.json"
-    serial_com = SerialCom(config_file)  # Assuming SerialCom needs to be instantiated
-    vfd_controller = VFDController(config_file, serial_com)
-    sensor_handler = SensorHandler(config_file, serial_com)
+    with open(config_file) as f:
+        engine = json.load(f)["serial"].get("engine", "threaded")
+    if engine == "asyncio":
+        run_async_engine(config_file)
+        sys.exit(0)
+
+    buses = SerialCom.open_buses(config_file)
+    # kill -USR1 <pid> dumps the transaction trace of every bus to logs/
+    signal.signal(signal.SIGUSR1, lambda signum, frame: [bus.dump_trace() for bus in buses.values()])
+    vfd_controller = VFDController(config_file, buses)
+    sensor_handler = SensorHandler(config_file, buses)
 
     # Create threads for running the VFD controller and sensor handler
     vfd_thread = threading.Thread(target=run_vfd_controller, args=(vfd_controller,))
@@ -0,0 +1,72 @@
+import bisect
+from array import array
+
+
+class Linear:
+    def __init__(self, scale: float = 1.0, offset: float = 0.0):
+        self.scale = scale
+        self.offset = offset
+
+    def __call__(self, raw: float) -> float:
+        return raw * self.scale + self.offset
+
+
+class PiecewiseLinear:
+    """
+    Interpolates between (raw, value) calibration points, extrapolating the first and last
+    segment beyond the table. Slopes and intercepts are computed once, a lookup is a bisect
+    and one multiply-add.
+    """
+
+    def __init__(self, points):
+        points = sorted((float(raw), float(value)) for raw, value in points)
+        if len(points) < 2:
+            raise ValueError("A piecewise-linear calibration needs at least 2 points")
+        self.bounds = array('d', [raw for raw, _ in points[1:-1]])
+        self.slopes = array('d')
+        self.intercepts = array('d')
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            slope = (y1 - y0) / (x1 - x0)
+            self.slopes.append(slope)
+            self.intercepts.append(y0 - slope * x0)
+
+    def __call__(self, raw: float) -> float:
+        i = bisect.bisect_right(self.bounds, raw)
+        return self.slopes[i] * raw + self.intercepts[i]
+
+
+class Polynomial:
+    """value = c0 + c1 * raw + c2 * raw ** 2 + ..., evaluated with Horner's scheme."""
+
+    def __init__(self, coefficients):
+        if not coefficients:
+            raise ValueError("A polynomial calibration needs at least 1 coefficient")
+        self.coefficients = tuple(float(c) for c in reversed(coefficients))
+
+    def __call__(self, raw: float) -> float:
+        value = 0.0
+        for c in self.coefficients:
+            value = value * raw + c
+        return value
+
+
+CALIBRATIONS = {
+    "linear": Linear,
+    "piecewise_linear": PiecewiseLinear,
+    "polynomial": Polynomial,
+}
+
+
+def make_calibration(config: dict = None, default=None):
+    """
+    Compiles a sensor's "calibration" config, e.g. {"type": "piecewise_linear", "points":
+    [[0, 0], [0.5, 70], [1, 150]]} mapping raw register values to engineering units.
+    Every key besides type is passed to the calibration's constructor.
+    """
+    if not config:
+        return default if default is not None else Linear()
+    params = dict(config)
+    kind = params.pop("type", "linear")
+    if kind not in CALIBRATIONS:
+        raise ValueError(f"Unknown calibration type {kind}, expected one of {', '.join(CALIBRATIONS)}")
+    return CALIBRATIONS[kind](**params)
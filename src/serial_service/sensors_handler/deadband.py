@@ -0,0 +1,31 @@
+import time
+
+
+class Deadband:
+    """
+    Report by exception: a value is due for publishing when it moved more than threshold
+    from the last published value, its quality changed, or heartbeat seconds have passed
+    since then. A threshold of 0 publishes every value.
+    """
+
+    def __init__(self, threshold: float = 0.0, heartbeat: float = 1.0):
+        self.threshold = threshold
+        self.heartbeat = heartbeat
+        self.last_value = None
+        self.last_quality = None
+        self.last_time = 0.0
+
+    def due(self, value: float, quality: int = 0, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if (
+            self.last_value is None
+            or abs(value - self.last_value) > self.threshold
+            or self.threshold == 0
+            or quality != self.last_quality
+            or now - self.last_time >= self.heartbeat
+        ):
+            self.last_value = value
+            self.last_quality = quality
+            self.last_time = now
+            return True
+        return False
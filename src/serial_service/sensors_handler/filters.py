@@ -0,0 +1,114 @@
+import bisect
+from array import array
+
+
+class Passthrough:
+    def update(self, value: float) -> float:
+        return value
+
+
+class MovingAverage:
+    """Mean of the last window samples, kept as a running sum over a preallocated ring."""
+
+    def __init__(self, window: int = 5):
+        self.window = window
+        self.samples = array('d', bytes(8 * window))
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def update(self, value: float) -> float:
+        self.total += value - self.samples[self.index]
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.window
+        if self.count < self.window:
+            self.count += 1
+        elif self.index == 0:
+            # Resum once per lap so rounding errors do not accumulate in the running sum
+            self.total = sum(self.samples)
+        return self.total / self.count
+
+
+class Median:
+    """Median of the last window samples, rejects single-sample spikes."""
+
+    def __init__(self, window: int = 5):
+        self.window = window
+        self.samples = array('d', bytes(8 * window))
+        self.sorted = array('d')
+        self.index = 0
+
+    def update(self, value: float) -> float:
+        if len(self.sorted) == self.window:
+            del self.sorted[bisect.bisect_left(self.sorted, self.samples[self.index])]
+        bisect.insort(self.sorted, value)
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % self.window
+        n = len(self.sorted)
+        if n % 2:
+            return self.sorted[n // 2]
+        return (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2
+
+
+class ExponentialSmoothing:
+    def __init__(self, alpha: float = 0.3):
+        """
+        :param alpha: Weight of the newest sample, 1 disables smoothing.
+        """
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value: float) -> float:
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class Kalman:
+    """Scalar Kalman filter for a slowly varying value (random walk model)."""
+
+    def __init__(self, process_noise: float = 0.01, measurement_noise: float = 1.0):
+        """
+        :param process_noise: Variance the true value drifts by per sample.
+        :param measurement_noise: Variance of the sensor noise.
+        """
+        self.q = process_noise
+        self.r = measurement_noise
+        self.value = None
+        self.p = 1.0
+
+    def update(self, value: float) -> float:
+        if self.value is None:
+            self.value = value
+            self.p = self.r
+            return value
+        self.p += self.q
+        gain = self.p / (self.p + self.r)
+        self.value += gain * (value - self.value)
+        self.p *= 1 - gain
+        return self.value
+
+
+FILTERS = {
+    "none": Passthrough,
+    "moving_average": MovingAverage,
+    "median": Median,
+    "ema": ExponentialSmoothing,
+    "kalman": Kalman,
+}
+
+
+def make_filter(config: dict = None):
+    """
+    Builds a filter from a sensor's "filter" config, e.g. {"type": "median", "window": 5}.
+    Every key besides type is passed to the filter's constructor.
+    """
+    if not config:
+        return Passthrough()
+    params = dict(config)
+    kind = params.pop("type", "none")
+    if kind not in FILTERS:
+        raise ValueError(f"Unknown filter type {kind}, expected one of {', '.join(FILTERS)}")
+    return FILTERS[kind](**params)
@@ -5,58 +5,149 @@ import struct
 import math
 import paho.mqtt.client as mqtt
 
-from serial_com.serial_com import SerialCom
+from serial_com.serial_com import SerialCom, DEFAULT_BUS
+from serial_com.register_map import RegisterMap, RegisterField
+from sensors_handler.filters import make_filter
+from sensors_handler.deadband import Deadband
+from sensors_handler.calibration import make_calibration, Linear
+from telemetry_codec import GOOD, STALE, FAILED, ESTIMATED
+from telemetry_codec import decode_reading, decode_frame
+
+class Totalizer:
+    """
+    Integrates the flow rate over time (trapezoidal rule) into a volume per test and per cycle.
+    Only the flow during a test counts, between start_test and end_test the volumes grow, after
+    end_test they hold the test's totals. Gaps longer than max_gap, e.g. while the meter is
+    unavailable, are not integrated.
+    """
+
+    def __init__(self, max_gap: float = 1.0):
+        self.max_gap = max_gap
+        self.test_volume = 0.0
+        self.cycle_volume = 0.0
+        self.last_time = None
+        self.last_rate = 0.0
+        # Counts until the first state is received, a meter restarted mid-test keeps totalizing
+        self.in_test = True
+
+    def add(self, rate: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        if self.in_test and self.last_time is not None and now - self.last_time <= self.max_gap:
+            volume = (rate + self.last_rate) / 2 * (now - self.last_time)
+            self.test_volume += volume
+            self.cycle_volume += volume
+        self.last_time = now
+        self.last_rate = rate
+
+    def volumes(self) -> dict:
+        return {"test": round(self.test_volume, 6), "cycle": round(self.cycle_volume, 6)}
+
+    def start_test(self):
+        self.test_volume = 0.0
+        self.cycle_volume = 0.0
+        self.last_time = None
+        self.in_test = True
+
+    def end_test(self):
+        self.in_test = False
+
+    def reset_cycle(self):
+        self.cycle_volume = 0.0
+
 
 class Sensor:
     def __init__(self, config, serial_com:SerialCom):
         self.name = config["name"]
         self.address = int(config["address"])
         self.debug = config["debug"]
+        self.frequency = float(config.get("frequency", 50))
+        self.bus = config.get("bus", DEFAULT_BUS)
+        self.filter = make_filter(config.get("filter"))
+        # Raw register value to differential pressure in Pa
+        self.calibration = make_calibration(config.get("calibration"), Linear(scale=1 / 10000))
+        # Filtered values are published every publish_every-th sample
+        self.publish_every = max(1, round(self.frequency / float(config.get("publish_rate", self.frequency))))
+        self.samples = 0
+        self.deadband = Deadband(float(config.get("deadband", 0)), float(config.get("heartbeat", 1.0)))
         self.serial_com = serial_com
         self.pressure_topic =  f"{config['pressure_sensor_device_id']}/sensors/{config['pressure_sensor_address']}"
+        self.pressure_frame_topic =  f"{config['pressure_sensor_device_id']}/sensors/frame"
+        self.pressure_address = str(config['pressure_sensor_address'])
         self.temprature_topic =  f"{config['pressure_sensor_device_id']}/sensors/temperature"
         self.humidity_topic =  f"{config['pressure_sensor_device_id']}/sensors/humidity"
         self.logger = self.setup_logger()
         self.last_t = 0
+        self.available = True
+        self.quality = GOOD
+        self.sample_time = time.monotonic()
+        # Until the ambient pressure is received the density, and so the flow, is an estimate
+        self.ambient_measured = False
         self.P = 0
         self.phi = 0.66 
         self.T = 87
-    # def setup_mqtt(self):
-    #     self.client = mqtt.Client()
-    #     self.client.on_connect = self.on_connect
-    #     self.client.on_message = self.on_message
-    #     self.client.connect(self.mqtt_broker, self.mqtt_port, 60)
-    #     self.client.loop_start()
-
-    # def on_connect(self, client, userdata, flags, rc, _):
-    #     self.logger.info("Connected to MQTT broker with result code " + str(rc))
-    #     client.subscribe(self.pressure_topic)
-    #     client.subscribe(self.temprature_topic)
-    #     client.subscribe(self.humidity_topic)
-
-    # def on_message(self, client, userdata, msg):
-    #     try:
-    #         if msg.topic == self.pressure_topic:
-    #             self.P = float(msg.payload.decode()) * 47.88 + 101300
-    #             self.logger.info(f"Received temperature from MQTT: {float(msg.payload.decode())},calcualted is {self.P}")
-    #         elif msg.topic == self.humidity_topic:
-    #             self.phi = float(msg.payload.decode()) / 100.0
-    #         elif msg.topic == self.temprature_topic:
-    #             self.T = float(msg.payload.decode())
-    #     except Exception as e:
-    #         self.logger.error(f"Error processing MQTT message: {e}")
+        if "registers" in config:
+            self.register_map = RegisterMap.from_config(config["registers"])
+        else:
+            self.register_map = RegisterMap([RegisterField("differential_pressure", 0x0424, "uint32")])
+        self.serial_com.declare_registers(self.address, self.register_map)
+        self.density = self.air_density()
+        self.totalizer = Totalizer()
+        self.state = None
+        self.cycle_index = None
+
+    def subscriptions(self, device_id):
+        """Topics the flow meter needs: ambient conditions, the state and the cycle counter of device_id."""
+        return [
+            self.pressure_topic,
+            self.pressure_frame_topic,
+            self.temprature_topic,
+            self.humidity_topic,
+            f"{device_id}/state",
+            f"{device_id}/cycle_index",
+        ]
+
+    def on_message(self, topic, payload: bytes):
+        if topic == self.pressure_frame_topic:
+            value = decode_frame(payload)["values"].get(self.pressure_address)
+            if value is not None:
+                self.set_ambient(P=float(value) * 47.88 + 101300)
+                self.ambient_measured = True
+        elif topic == self.pressure_topic:
+            self.set_ambient(P=decode_reading(payload)[0] * 47.88 + 101300)
+            self.ambient_measured = True
+        elif topic == self.humidity_topic:
+            self.set_ambient(phi=decode_reading(payload)[0] / 100.0)
+        elif topic == self.temprature_topic:
+            self.set_ambient(T=decode_reading(payload)[0])
+        elif topic.endswith("/state"):
+            # A test runs from leaving idle until idle is entered again
+            state = payload.decode()
+            if state == "idle":
+                self.totalizer.end_test()
+            elif self.state == "idle":
+                self.totalizer.start_test()
+            self.state = state
+        elif topic.endswith("/cycle_index"):
+            if payload != self.cycle_index:
+                if self.cycle_index is not None:
+                    self.totalizer.reset_cycle()
+                self.cycle_index = payload
+
+    def set_ambient(self, P=None, phi=None, T=None):
+        """Updates the ambient conditions, the air density is only recomputed when one of them changes."""
+        P = self.P if P is None else P
+        phi = self.phi if phi is None else phi
+        T = self.T if T is None else T
+        if (P, phi, T) != (self.P, self.phi, self.T):
+            self.P, self.phi, self.T = P, phi, T
+            self.density = self.air_density()
 
     def read_32bit_register_as_float(self,address):
         try:
-            # Read two 16-bit registers (4 bytes) from the given address
-            registers = self.serial_com.read_register(self.address, address, 2, functioncode=3)
-            print(f"Raw register values: {registers}")
-            # Convert the two 16-bit registers to a 32-bit float using IEEE 754 format
-            packed_data = struct.pack('>HH', registers[0], registers[1])
-            value = struct.unpack('>I', packed_data)[0]
-            return value
+            # Every declared value comes back from one block read, decoded as big-endian 32-bit
+            return self.serial_com.read_map(self.address)["differential_pressure"]
         except Exception as e:
-            print(f"Error reading float from address {address}: {e}")
+            self.logger.debug(f"Error reading float from address {address}: {e}")
             return None
     def setup_logger(self):
         logger = logging.getLogger(self.__class__.__name__)
@@ -66,7 +157,7 @@ class Sensor:
         ch.setFormatter(formatter)
         logger.addHandler(ch)
         return logger
-    def calc(self,deltaP):
+    def air_density(self):
         phi = self.phi
         P = self.P
         T = self.T
@@ -79,19 +170,44 @@ class Sensor:
         nominator = n1 + n2
         denominator = 8.31446 * T
         
-        ro = nominator / denominator
-        
-        qv = 0.032429 * math.sqrt(deltaP * 2 / ro)
+        return nominator / denominator
+
+    def calc(self,deltaP):
+        qv = 0.032429 * math.sqrt(deltaP * 2 / self.density)
         
         return qv
 
+    def convert(self, values):
+        return self.calc(self.calibration(values["differential_pressure"]))
+
+    def sample(self, values):
+        """Converts, filters and totalizes one reading."""
+        flow = self.filter.update(self.convert(values))
+        self.totalizer.add(flow)
+        return flow
+
+    def read_succeeded(self):
+        self.available = True
+        self.quality = GOOD if self.ambient_measured else ESTIMATED
+        self.sample_time = time.monotonic()
+
+    def read_failed(self):
+        # A single failed read keeps the last value, the slave's circuit breaker decides availability
+        self.available = self.serial_com.is_available(self.address)
+        self.quality = STALE if self.available else FAILED
+
+    def age(self):
+        """Seconds since the last good read, or since startup if there was none."""
+        return time.monotonic() - self.sample_time
+
     def read(self):
         register_address = 0x0424
         value = self.read_32bit_register_as_float(register_address)
         try:
-            self.last_t = self.calc(value / 10000)
+            self.last_t = self.sample({"differential_pressure": value})
+            self.read_succeeded()
         except Exception as e:
             # self.logger.error(f'Flow ignored writing command {e}')
-            pass
+            self.read_failed()
         return self.last_t
     
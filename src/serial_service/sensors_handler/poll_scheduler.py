@@ -0,0 +1,50 @@
+import heapq
+import time
+
+
+class PollScheduler:
+    """
+    Earliest-deadline-first scheduling of sensor polls, each at its own rate.
+
+    Start times are staggered across one period so that sensors sharing a rate do not
+    all hit the bus at once. A poll that starts more than one period late counts as a
+    missed deadline and its schedule is realigned instead of bursting to catch up.
+    """
+
+    def __init__(self):
+        self.queue = []
+        self.missed = {}
+
+    def schedule(self, items):
+        """
+        :param items: (key, frequency in Hz) pairs, key being any orderable identifier.
+        """
+        now = time.monotonic()
+        items = list(items)
+        self.queue = []
+        for index, (key, frequency) in enumerate(items):
+            period = 1.0 / frequency
+            offset = period * index / len(items)
+            heapq.heappush(self.queue, (now + offset, index, key, period))
+            self.missed[key] = 0
+
+    def next(self):
+        """Sleeps until the earliest deadline and returns its key."""
+        deadline, index, key, period = heapq.heappop(self.queue)
+        now = time.monotonic()
+        if deadline > now:
+            time.sleep(deadline - now)
+            now = deadline
+        next_deadline = deadline + period
+        if now > next_deadline:
+            self.missed[key] += 1
+            next_deadline = now + period
+        heapq.heappush(self.queue, (next_deadline, index, key, period))
+        return key
+
+    def take_missed(self) -> dict:
+        """Returns the missed deadline counts since the previous call, and resets them."""
+        missed = {key: count for key, count in self.missed.items() if count}
+        for key in missed:
+            self.missed[key] = 0
+        return missed
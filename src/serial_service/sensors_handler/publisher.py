@@ -0,0 +1,90 @@
+import json
+import threading
+
+from telemetry_codec import encode_reading, encode_quality, encode_frame, GOOD
+
+
+class TelemetryPublisher:
+    """
+    Publishes sensor readings, frames and availability for both serial engines. The engines
+    only poll and decide when a reading is due, the topics and payloads are built here.
+    """
+
+    def __init__(self, client, device_id, binary=False, frames=False, logger=None):
+        self.client = client
+        self.device_id = device_id
+        self.binary = binary
+        self.frames = frames
+        self.logger = logger
+        self.published_availability = {}
+        self.published_quality = {}
+        self.frame_values = {}
+        self.frame_lock = threading.Lock()
+        self.frame_seq = 0
+
+    def publish(self, sensor, value, polled):
+        """
+        Publishes a due reading, into the pending frame when frames are on, and the totalizer
+        volumes of an available flow meter on {device_id}/sensors/{address}/volume.
+        """
+        topic = f"{self.device_id}/sensors/{sensor.address}"
+        if self.frames:
+            self.add_to_frame(str(sensor.address), (value, sensor.quality, sensor.age(), polled))
+        else:
+            self.publish_reading(topic, sensor, value)
+        if sensor.available and hasattr(sensor, "totalizer"):
+            self.client.publish(f"{topic}/volume", json.dumps(sensor.totalizer.volumes()))
+
+    def publish_reading(self, topic, sensor, value):
+        """
+        Publishes a reading on topic. As JSON its quality and age go first on {topic}/quality,
+        with every reading that is not good and once more when the sensor is good again.
+        """
+        if not self.binary and (sensor.quality != GOOD or self.published_quality.get(sensor.address, GOOD) != GOOD):
+            self.client.publish(f"{topic}/quality", encode_quality(sensor.quality, sensor.age()))
+            self.published_quality[sensor.address] = sensor.quality
+        self.client.publish(topic, encode_reading(value, sensor.quality, sensor.age(), self.binary))
+
+    def publish_availability(self, sensor):
+        """Publishes a retained 1/0 on {device_id}/sensors/{address}/available whenever it changes."""
+        if self.published_availability.get(sensor.address) == sensor.available:
+            return
+        self.published_availability[sensor.address] = sensor.available
+        self.client.publish(f"{self.device_id}/sensors/{sensor.address}/available", int(sensor.available), retain=True)
+        if self.logger is None:
+            return
+        if sensor.available:
+            self.logger.info(f"Sensor {sensor.name} is available")
+        else:
+            self.logger.warning(f"Sensor {sensor.name} is unavailable, its last value is published as failed")
+
+    def add_to_frame(self, address, reading):
+        """
+        Adds a reading to the pending frame. A frame holds one reading per sensor, a sensor
+        polled again before the frame went out publishes the pending frame first.
+        """
+        with self.frame_lock:
+            frame = self.encode_pending() if address in self.frame_values else None
+            self.frame_values[address] = reading
+        if frame is not None:
+            self.publish_frame(frame)
+
+    def take_frame(self):
+        """Encodes and clears the pending frame, None if it is empty."""
+        with self.frame_lock:
+            return self.encode_pending()
+
+    def encode_pending(self):
+        """Called with frame_lock held."""
+        values, self.frame_values = self.frame_values, {}
+        if not values:
+            return None
+        self.frame_seq += 1
+        return encode_frame(self.frame_seq, values, self.binary)
+
+    def publish_frame(self, frame):
+        """
+        Publishes a frame on {device_id}/sensors/frame: {"seq": n, "t": capture time of the
+        oldest reading, "values": {address: value}, "time": {address: capture time}, ...}.
+        """
+        self.client.publish(f"{self.device_id}/sensors/frame", frame)
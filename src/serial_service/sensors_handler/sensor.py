@@ -2,7 +2,12 @@ import os
 import time
 import logging
 
-from serial_com.serial_com import SerialCom
+from serial_com.serial_com import SerialCom, DEFAULT_BUS
+from serial_com.register_map import RegisterMap, RegisterField
+from sensors_handler.filters import make_filter
+from sensors_handler.deadband import Deadband
+from sensors_handler.calibration import make_calibration, Linear
+from telemetry_codec import GOOD, STALE, FAILED
 
 class Sensor:
     def __init__(self, config, serial_com:SerialCom):
@@ -10,8 +15,24 @@ class Sensor:
         self.name = config["name"]
         self.address = int(config["address"])
         self.debug = config["debug"]
+        self.frequency = float(config.get("frequency", 50))
+        self.bus = config.get("bus", DEFAULT_BUS)
+        self.filter = make_filter(config.get("filter"))
+        self.calibration = make_calibration(config.get("calibration"), Linear(scale=144))
+        # Filtered values are published every publish_every-th sample
+        self.publish_every = max(1, round(self.frequency / float(config.get("publish_rate", self.frequency))))
+        self.samples = 0
+        self.deadband = Deadband(float(config.get("deadband", 0)), float(config.get("heartbeat", 1.0)))
         self.logger = self.setup_logger()
         self.last_t = 0
+        self.available = True
+        self.quality = GOOD
+        self.sample_time = time.monotonic()
+        if "registers" in config:
+            self.register_map = RegisterMap.from_config(config["registers"])
+        else:
+            self.register_map = RegisterMap([RegisterField("pressure", 1028, "float")])
+        self.serial_com.declare_registers(self.address, self.register_map)
         
     def setup_logger(self):
         logger = logging.getLogger(self.__class__.__name__)
@@ -23,11 +44,33 @@ class Sensor:
         return logger
     
 
+    def convert(self, values):
+        return self.calibration(values["pressure"])
+
+    def sample(self, values):
+        """Converts and filters one reading."""
+        return self.filter.update(self.convert(values))
+
+    def read_succeeded(self):
+        self.available = True
+        self.quality = GOOD
+        self.sample_time = time.monotonic()
+
+    def read_failed(self):
+        # A single failed read keeps the last value, the slave's circuit breaker decides availability
+        self.available = self.serial_com.is_available(self.address)
+        self.quality = STALE if self.available else FAILED
+
+    def age(self):
+        """Seconds since the last good read, or since startup if there was none."""
+        return time.monotonic() - self.sample_time
+
     def read(self):
         try:
-            self.last_t = self.serial_com.read_float(self.address, 1028, 3) * 144
+            self.last_t = self.sample(self.serial_com.read_map(self.address))
+            self.read_succeeded()
         except:
+            self.read_failed()
             # self.logger.error('ignored writing [read] command')
-            pass
         return self.last_t
     
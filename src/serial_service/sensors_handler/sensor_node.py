@@ -2,21 +2,37 @@ import json
 import paho.mqtt.client as mqtt
 import logging
 import time
+import threading
 
 from sensors_handler.sensor import Sensor as PressureSensor
 from sensors_handler.flow_sensor import Sensor as FlowSensor
-from serial_com.serial_com import SerialCom
+from sensors_handler.poll_scheduler import PollScheduler
+from serial_com.serial_com import SerialCom, DEFAULT_BUS, resolve_bus
+from sensors_handler.publisher import TelemetryPublisher
 
 class SensorHandler:
-    def __init__(self, config_file, serial_com : SerialCom):
+    def __init__(self, config_file, serial_com):
+        """
+        :param serial_com: A SerialCom, or the dict of buses from SerialCom.open_buses.
+        """
         self.serial_com = serial_com
         self.sensors: list = []
+        self.running = False
+        self.missed_report_interval = 10
         self.load_config(config_file)
+        # topic: sensors that consume it, e.g. the flow meter's ambient conditions
+        self.sensor_topics = {}
+        for sensor in self.sensors:
+            if hasattr(sensor, "subscriptions"):
+                for topic in sensor.subscriptions(self.device_id):
+                    self.sensor_topics.setdefault(topic, []).append(sensor)
         self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.mqtt_client.on_connect = self.on_mqtt_connect
         self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+        self.mqtt_client.on_message = self.on_mqtt_message
         self.mqtt_connected = False
         self.logger = self.setup_logger()  # Initialize logger with class name
+        self.publisher = TelemetryPublisher(self.mqtt_client, self.device_id, self.binary, self.frames, self.logger)
         self.connect_mqtt_broker()
                 
     def setup_logger(self):
@@ -32,15 +48,23 @@ class SensorHandler:
             config = json.load(f)
             self.device_id = config["device_id"]
             self.mqtt_config = config["mqtt"]
+            self.diagnostics_interval = config["serial"].get("diagnostics_interval", 10)
+            telemetry = config.get("telemetry", {})
+            self.frames = telemetry.get("frames", False)
+            self.frame_rate = telemetry.get("frame_rate", 50)
+            self.binary = telemetry.get("encoding", "json") == "binary"
             for sensor_config in config["sensors"]:
                 self.add_sensor(sensor_config)
 
     def add_sensor(self, sensor_config):
+        if not sensor_config.get('active', True):
+            return
+        serial_com = resolve_bus(self.serial_com, sensor_config.get('bus', DEFAULT_BUS))
         if sensor_config['type'] == 'pressure':
-            sensor = PressureSensor(sensor_config,serial_com=self.serial_com)
+            sensor = PressureSensor(sensor_config,serial_com=serial_com)
             self.sensors.append(sensor)
         elif sensor_config['type'] == 'flow':
-            sensor = FlowSensor(sensor_config,serial_com=self.serial_com)
+            sensor = FlowSensor(sensor_config,serial_com=serial_com)
             self.sensors.append(sensor)
 
     def connect_mqtt_broker(self):
@@ -58,9 +82,18 @@ class SensorHandler:
         if rc == 0:
             self.logger.info("Connected to MQTT broker")
             self.mqtt_connected = True
+            for topic in self.sensor_topics:
+                client.subscribe(topic)
         else:
             self.logger.error("Failed to connect to MQTT broker")
 
+    def on_mqtt_message(self, client, userdata, msg):
+        for sensor in self.sensor_topics.get(msg.topic, ()):
+            try:
+                sensor.on_message(msg.topic, msg.payload)
+            except Exception as e:
+                self.logger.error(f"Error processing {msg.topic} for {sensor.name}: {e}")
+
     def on_mqtt_disconnect(self, client, userdata, rc,_,__):
         self.logger.warning("Disconnected from MQTT broker")
         self.mqtt_connected = False
@@ -71,20 +104,80 @@ class SensorHandler:
         try:
             if self.mqtt_connected:
                 sensor_reading = sensor.read()
-                self.mqtt_client.publish(topic, int(sensor_reading*100)/100)
-                self.logger.info(f"Published reading for {sensor.name}: {sensor_reading} on {topic}")
+                polled = time.time()
+                self.publisher.publish_availability(sensor)
+                sensor.samples += 1
+                if sensor.samples % sensor.publish_every:
+                    return
+                # Failed and stale readings are published too, flagged by their quality
+                value = int(sensor_reading*100)/100
+                if not sensor.deadband.due(value, sensor.quality):
+                    return
+                self.publisher.publish(sensor, value, polled)
+                self.logger.debug(f"Published reading for {sensor.name}: {sensor_reading} on {topic}")
             else:
                 self.logger.warning("MQTT broker not connected. Cannot publish reading.")
         except Exception as e:
-            # self.logger.error(f"Error sending reading for {sensor.name}: {e}")
-            pass
+            self.logger.error(f"Error sending reading for {sensor.name}: {e}")
 
     def run(self):
-        while True:
-            for sensor in self.sensors:
-                self.send_sensor_reading(sensor)
-            time.sleep( 1 / 50)  # Adjust as needed
+        """Polls every bus in parallel, one worker thread per bus."""
+        buses = {}
+        for sensor in self.sensors:
+            buses.setdefault(sensor.bus, []).append(sensor)
+        self.running = bool(buses)
+        workers = [
+            threading.Thread(target=self.poll_bus, args=(bus, sensors), name=f"poll-{bus}")
+            for bus, sensors in buses.items()
+        ]
+        threading.Thread(target=self.publish_diagnostics, name="serial-diagnostics", daemon=True).start()
+        if self.frames:
+            threading.Thread(target=self.publish_frames, name="sensor-frames", daemon=True).start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def publish_frames(self):
+        """Publishes the readings collected during each frame period as one frame."""
+        period = 1.0 / self.frame_rate
+        deadline = time.monotonic()
+        while self.running:
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                deadline = time.monotonic()
+            frame = self.publisher.take_frame()
+            if frame is None or not self.mqtt_connected:
+                continue
+            self.publisher.publish_frame(frame)
+
+    def publish_diagnostics(self):
+        """Publishes the bus statistics of every bus on {device_id}/diagnostics/serial."""
+        buses = self.serial_com if isinstance(self.serial_com, dict) else {self.serial_com.bus: self.serial_com}
+        while self.running:
+            time.sleep(self.diagnostics_interval)
+            diagnostics = {name: bus.stats.take() for name, bus in buses.items()}
+            if self.mqtt_connected:
+                self.mqtt_client.publish(f"{self.device_id}/diagnostics/serial", json.dumps(diagnostics))
+
+    def poll_bus(self, bus, sensors):
+        scheduler = PollScheduler()
+        scheduler.schedule((i, sensor.frequency) for i, sensor in enumerate(sensors))
+        last_report = time.monotonic()
+        while self.running:
+            self.send_sensor_reading(sensors[scheduler.next()])
+            now = time.monotonic()
+            if now - last_report >= self.missed_report_interval:
+                last_report = now
+                missed = scheduler.take_missed()
+                if missed:
+                    summary = ", ".join(f"{sensors[i].name}: {count}" for i, count in missed.items())
+                    self.logger.warning(f"Missed polling deadlines on bus {bus} in the last {self.missed_report_interval}s ({summary})")
 
     def stop(self):
+        self.running = False
         self.mqtt_client.disconnect()
 
@@ -0,0 +1,75 @@
+import threading
+import time
+
+import minimalmodbus
+
+from serial_com.trace import Outcome
+from serial_com.scheduler import Priority
+
+# Only reads are skipped while a slave's breaker is open, control and stop writes always go on the bus
+GUARDED_PRIORITIES = frozenset((Priority.VFD_FEEDBACK, Priority.SENSOR_POLL))
+
+
+class SlaveUnavailableError(minimalmodbus.ModbusException):
+    """Raised without touching the bus while a slave's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Per-slave breaker: after failure_threshold consecutive failed transactions reads of the
+    slave are skipped, except for a single probe once the backoff has passed. A failed probe doubles
+    the backoff (up to max_backoff), a successful one closes the breaker again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    # A slave that reports an exception is alive, only these outcomes count as failures
+    FAILURES = (Outcome.NO_RESPONSE, Outcome.INVALID_RESPONSE, Outcome.SERIAL_ERROR)
+
+    def __init__(self, address: int, failure_threshold: int = 3, min_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.address = address
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff = min_backoff
+        self.retry_at = 0.0
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raises SlaveUnavailableError unless the transaction may go on the bus."""
+        if self.state == self.CLOSED:
+            return
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                return
+        raise SlaveUnavailableError(f"Slave {self.address} unavailable, circuit breaker is {self.state}")
+
+    def record(self, outcome: Outcome):
+        """Updates the breaker with the outcome of a transaction, returns True if the state changed."""
+        with self.lock:
+            previous = self.state
+            if outcome not in self.FAILURES:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.backoff = self.min_backoff
+            elif self.state == self.HALF_OPEN:
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+                self._open()
+            else:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self._open()
+            return self.state != previous
+
+    def _open(self):
+        self.state = self.OPEN
+        self.retry_at = time.monotonic() + self.backoff
+
+    @property
+    def available(self) -> bool:
+        return self.state == self.CLOSED
@@ -0,0 +1,114 @@
+import time
+import logging
+
+import minimalmodbus
+import serial
+
+
+class PortSession:
+    """
+    Keeps the serial port of a minimalmodbus instrument open across transactions.
+
+    A transaction that fails with a serial/OS error (device unplugged, EIO), or a run of
+    consecutive invalid responses (framing storm), marks the session broken. The port is
+    then reopened before the next transaction, backing off exponentially while it keeps failing.
+    """
+
+    def __init__(
+        self,
+        instrument: minimalmodbus.Instrument,
+        logger: logging.Logger,
+        min_backoff: float = 0.1,
+        max_backoff: float = 5.0,
+        framing_error_limit: int = 5,
+        report_interval: float = 10.0,
+    ):
+        self.instrument = instrument
+        self.logger = logger
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.framing_error_limit = framing_error_limit
+        self.report_interval = report_interval
+
+        self.broken = False
+        self.backoff = min_backoff
+        self.next_open_attempt = 0.0
+        self.framing_errors = 0
+        self.reopens = 0
+
+        self.transactions = 0
+        self.window_start = time.monotonic()
+        self.window_transactions = 0
+        self.tps = 0.0
+
+    def execute(self, func, *args, **kwargs):
+        """Runs one transaction on the open port, reopening it first if the session is broken."""
+        self._ensure_open()
+        try:
+            result = func(*args, **kwargs)
+        except minimalmodbus.InvalidResponseError:
+            self.framing_errors += 1
+            if self.framing_errors >= self.framing_error_limit:
+                self._mark_broken(f"{self.framing_errors} consecutive invalid responses")
+            raise
+        except minimalmodbus.ModbusException:
+            # Modbus errors derive from IOError but say nothing about the port itself
+            raise
+        except (serial.SerialException, OSError) as e:
+            self._mark_broken(f"serial error: {e}")
+            raise
+        self.framing_errors = 0
+        self._count_transaction()
+        return result
+
+    def transactions_per_second(self) -> float:
+        """Successful transactions per second over the last completed report window."""
+        return self.tps
+
+    def _ensure_open(self):
+        port = self.instrument.serial
+        if self.instrument.close_port_after_each_call:
+            # minimalmodbus opens and closes the port itself in this mode
+            return
+        if not self.broken and port.is_open:
+            return
+        now = time.monotonic()
+        if now < self.next_open_attempt:
+            raise serial.SerialException(
+                f"Port {port.port} is down, next reopen attempt in {self.next_open_attempt - now:.2f}s"
+            )
+        try:
+            port.close()
+            port.open()
+        except (serial.SerialException, OSError) as e:
+            self.next_open_attempt = now + self.backoff
+            self.logger.error(f"Failed to reopen {port.port}, retrying in {self.backoff:.2f}s: {e}")
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+            raise
+        self.broken = False
+        self.framing_errors = 0
+        self.backoff = self.min_backoff
+        self.reopens += 1
+        self.logger.info(f"Reopened {port.port}")
+
+    def _mark_broken(self, reason: str):
+        if not self.broken:
+            self.logger.warning(f"Serial session broken ({reason}), port will be reopened")
+        self.broken = True
+
+    def _count_transaction(self):
+        self.transactions += 1
+        self.window_transactions += 1
+        now = time.monotonic()
+        elapsed = now - self.window_start
+        if elapsed >= self.report_interval:
+            self.tps = self.window_transactions / elapsed
+            self.logger.info(
+                f"{self.tps:.1f} transactions/s on {self.instrument.serial.port} "
+                f"({self.transactions} total, {self.reopens} reopens)"
+            )
+            self.window_start = now
+            self.window_transactions = 0
+
+    def close(self):
+        self.instrument.serial.close()
@@ -0,0 +1,60 @@
+import struct
+
+
+class RegisterField:
+    """A single value living in a slave's holding registers."""
+
+    # kind -> (struct format, number of 16-bit registers)
+    KINDS = {
+        "float": (">f", 2),
+        "uint32": (">I", 2),
+        "int32": (">i", 2),
+        "uint16": (">H", 1),
+        "int16": (">h", 1),
+    }
+
+    def __init__(self, name: str, register: int, kind: str = "float", word_swap: bool = False):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unsupported register kind: {kind}")
+        self.name = name
+        self.register = int(register)
+        self.kind = kind
+        self.word_swap = word_swap
+        self.fmt, self.count = self.KINDS[kind]
+
+    def decode(self, registers, offset: int):
+        words = registers[offset:offset + self.count]
+        if self.word_swap:
+            words = words[::-1]
+        return struct.unpack(self.fmt, struct.pack(f">{self.count}H", *words))[0]
+
+
+class RegisterMap:
+    """
+    Declared set of values for one slave, served from a single function code 3
+    block read spanning the lowest to the highest register in the map.
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        if not self.fields:
+            raise ValueError("A register map needs at least one field")
+        self.start = min(f.register for f in self.fields)
+        end = max(f.register + f.count for f in self.fields)
+        self.count = end - self.start
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds a map from a list of {"name", "register", "kind", "word_swap"} dicts."""
+        return cls(
+            RegisterField(
+                f["name"],
+                int(str(f["register"]), 0),
+                f.get("kind", "float"),
+                f.get("word_swap", False),
+            )
+            for f in config
+        )
+
+    def decode(self, registers):
+        return {f.name: f.decode(registers, f.register - self.start) for f in self.fields}
@@ -0,0 +1,67 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    """Bus access classes, lower value wins."""
+    EMERGENCY_STOP = 0
+    VFD_CONTROL = 1
+    VFD_FEEDBACK = 2
+    SENSOR_POLL = 3
+
+
+class TransactionScheduler:
+    """
+    Grants the half-duplex bus to one transaction at a time, highest priority first.
+
+    A transaction is never interrupted once on the wire; when it ends the bus is handed
+    straight to the most urgent waiter (FIFO within a class). An emergency stop therefore
+    waits for at most the transaction in flight plus any earlier emergency transactions.
+    """
+
+    def __init__(self, logger: logging.Logger, latency_bound: float = 0.1):
+        self.logger = logger
+        self.latency_bound = latency_bound
+        self._mutex = threading.Lock()
+        self._busy = False
+        self._waiters = []
+        self._seq = itertools.count()
+        self.max_wait = {p: 0.0 for p in Priority}
+
+    @contextmanager
+    def transaction(self, priority: Priority):
+        waited = self.acquire(priority)
+        if waited > self.max_wait[priority]:
+            self.max_wait[priority] = waited
+        if priority == Priority.EMERGENCY_STOP and waited > self.latency_bound:
+            self.logger.warning(f"Emergency transaction waited {waited * 1000:.1f} ms for the bus")
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, priority: Priority) -> float:
+        """Blocks until the bus is granted to the caller, returns the time spent waiting."""
+        with self._mutex:
+            if not self._busy:
+                self._busy = True
+                return 0.0
+            granted = threading.Event()
+            heapq.heappush(self._waiters, (int(priority), next(self._seq), granted))
+        start = time.monotonic()
+        granted.wait()
+        return time.monotonic() - start
+
+    def release(self):
+        with self._mutex:
+            if self._waiters:
+                # The bus stays busy and passes directly to the next transaction
+                _, _, granted = heapq.heappop(self._waiters)
+                granted.set()
+            else:
+                self._busy = False
@@ -5,16 +5,36 @@ import threading
 import logging
 from logging.handlers import RotatingFileHandler
 import os
+import time
 
 
 from typing import Union
 
+from serial_com.register_map import RegisterMap
+from serial_com.port_session import PortSession
+from serial_com.scheduler import Priority, TransactionScheduler
+from serial_com.trace import TransactionTrace, classify
+from serial_com.circuit_breaker import CircuitBreaker, GUARDED_PRIORITIES
+from serial_com.stats import BusStatistics
+
+DEFAULT_BUS = "default"
+
+
 class SerialCom:
-    def __init__(self, config_file):
-        self.lock = threading.Lock()
+    def __init__(self, config_file, bus: str = DEFAULT_BUS):
+        """
+        :param config_file: Path to config.json.
+        :param bus: Name of the bus to open. Entries under "buses" override the "serial" settings,
+                    the default bus uses "serial" as is.
+        """
+        self.bus = bus
+        self.register_maps = {}
         try:
             with open(config_file) as f:
-                config = json.load(f)["serial"]
+                full_config = json.load(f)
+                config = full_config["serial"]
+                if bus != DEFAULT_BUS:
+                    config = {**config, **full_config["buses"][bus]}
                 self.port = config["port"]
                 self.baudrate = config["baudrate"]
                 self.bytesize = config["bytesize"]
@@ -24,6 +44,10 @@ class SerialCom:
                 self.mode = getattr(minimalmodbus, config["mode"])
                 self.clear_buffers_before_each_transaction = config["clear_buffers_before_each_transaction"]
                 self.close_port_after_each_call = config["close_port_after_each_call"]
+                self.session_config = config.get("session", {})
+                self.emergency_latency_bound = config.get("emergency_latency_bound", 0.1)
+                self.trace_config = config.get("trace", {})
+                self.breaker_config = config.get("circuit_breaker", {})
         except (FileNotFoundError, KeyError, json.JSONDecodeError) as e:
             logging.error(f"Error loading configuration: {e}", exc_info=True)
             raise
@@ -47,43 +71,140 @@ class SerialCom:
                 logging.StreamHandler()
             ]
         )
-        self.logger = logging.getLogger(self.__class__.__name__)
+        self.logger = logging.getLogger(self.__class__.__name__ if bus == DEFAULT_BUS else f"{self.__class__.__name__}.{bus}")
+        self.session = PortSession(
+            self.comport,
+            self.logger,
+            min_backoff=self.session_config.get("min_backoff", 0.1),
+            max_backoff=self.session_config.get("max_backoff", 5.0),
+            framing_error_limit=self.session_config.get("framing_error_limit", 5),
+            report_interval=self.session_config.get("report_interval", 10.0),
+        )
+        self.scheduler = TransactionScheduler(self.logger, self.emergency_latency_bound)
+        self.trace = TransactionTrace(
+            capacity=self.trace_config.get("capacity", 4096),
+            summary_interval=self.trace_config.get("summary_interval", 60.0),
+        )
+        self.trace_dump_interval = self.trace_config.get("dump_on_error_interval", 60.0)
+        self.last_trace_dump = None
+        self.breakers = {}
+        self.stats = BusStatistics()
 
-    def _execute_with_lock(self, address: int, func, *args, **kwargs):
-        """Helper method to execute a function with address setting and locking."""
-        with self.lock:
-            self.logger.info(f"Acquiring lock and setting address to {address}")
-            self.comport.address = address
-            try:
-                result = func(*args, **kwargs)
-                self.logger.info(f"Operation successful for address {address}")
-                return result
-            except Exception as e:
-                self.logger.warn(f"Error during operation at address {address}: {e}", exc_info=True)
-                raise
-            finally:
-                self.logger.info(f"Releasing lock for address {address}")
+    @classmethod
+    def open_buses(cls, config_file) -> dict:
+        """Opens the default bus and every bus declared under "buses", keyed by bus name."""
+        with open(config_file) as f:
+            names = list(json.load(f).get("buses", {}))
+        buses = {DEFAULT_BUS: cls(config_file)}
+        for name in names:
+            if name != DEFAULT_BUS:
+                buses[name] = cls(config_file, name)
+        return buses
 
-    def read_float(self, address: int, register: int, number_of_registers: int):
-        return self._execute_with_lock(address, self.comport.read_float, register, number_of_registers)
+    def _execute_with_lock(
+        self, address: int, func, *args,
+        priority: Priority = Priority.SENSOR_POLL, functioncode: int = 3, register: int = 0, **kwargs
+    ):
+        """
+        Helper method to execute a function with address setting, once the scheduler grants the bus.
+        Every transaction is recorded in the trace, functioncode and register are only used for that.
+        Reads of a slave whose circuit breaker is open are skipped with SlaveUnavailableError,
+        control and emergency stop writes always go on the bus.
+        """
+        breaker = self.breaker(address)
+        if priority in GUARDED_PRIORITIES:
+            breaker.before_call()
+        error = None
+        breaker_changed = False
+        trace_dump = None
+        try:
+            with self.scheduler.transaction(priority):
+                self.comport.address = address
+                wall_start = time.time()
+                start = time.perf_counter()
+                try:
+                    return self.session.execute(func, *args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    duration = time.perf_counter() - start
+                    outcome = classify(error)
+                    self.trace.record(wall_start, duration, address, functioncode, register, outcome)
+                    self.stats.record(address, functioncode, duration, outcome)
+                    breaker_changed = breaker.record(outcome)
+                    if error is not None:
+                        trace_dump = self._trace_snapshot_on_error()
+        finally:
+            # Logging and file I/O happen once the bus is released, never while holding it
+            if error is not None:
+                self.logger.debug(f"Error during operation at address {address}: {error}", exc_info=error)
+            if breaker_changed:
+                self.logger.warning(f"Circuit breaker for address {address} is now {breaker.state}")
+            if trace_dump is not None:
+                try:
+                    self.dump_trace(data=trace_dump)
+                except OSError as e:
+                    self.logger.error(f"Failed to dump transaction trace: {e}")
+            summary = self.trace.take_summary()
+            if summary:
+                self.logger.info(summary)
+
+    def breaker(self, address: int) -> CircuitBreaker:
+        if address not in self.breakers:
+            self.breakers[address] = CircuitBreaker(
+                address,
+                failure_threshold=self.breaker_config.get("failure_threshold", 3),
+                min_backoff=self.breaker_config.get("min_backoff", 1.0),
+                max_backoff=self.breaker_config.get("max_backoff", 60.0),
+            )
+        return self.breakers[address]
+
+    def is_available(self, address: int) -> bool:
+        """False while the slave's circuit breaker is open or probing."""
+        return self.breaker(address).available
 
-    def read_int(self, address: int, register: int, number_of_registers: int):
-        return self._execute_with_lock(address, self.comport.read_int, register, number_of_registers)
+    def dump_trace(self, path: str = None, data: bytes = None) -> str:
+        """
+        Writes the transaction trace to path, by default logs/serial_trace_<bus>.bin.
+        Read it back with TransactionTrace.load.
+
+        :param data: A snapshot taken earlier with TransactionTrace.snapshot, by default the current records.
+        """
+        if path is None:
+            path = os.path.join("logs", f"serial_trace_{self.bus}.bin")
+        count = self.trace.dump(path, data)
+        self.logger.info(f"Dumped {count} transaction records to {path}")
+        return path
 
-    def read_string(self, address: int, register: int, number_of_registers: int):
-        return self._execute_with_lock(address, self.comport.read_string, register, number_of_registers)
+    def _trace_snapshot_on_error(self):
+        """The trace records to dump after an error, None if the last dump is more recent than dump_on_error_interval."""
+        now = time.monotonic()
+        if self.last_trace_dump is not None and now - self.last_trace_dump < self.trace_dump_interval:
+            return None
+        self.last_trace_dump = now
+        return self.trace.snapshot()
 
-    def write_float(self, address: int, register: int, value: float, number_of_decimals: int = 0):
-        return self._execute_with_lock(address, self.comport.write_float, register, value, number_of_decimals)
+    def read_float(self, address: int, register: int, number_of_registers: int, priority: Priority = Priority.SENSOR_POLL):
+        return self._execute_with_lock(address, self.comport.read_float, register, number_of_registers, priority=priority, register=register)
 
-    def write_int(self, address: int, register: int, value: int):
-        return self._execute_with_lock(address, self.comport.write_int, register, value)
+    def read_int(self, address: int, register: int, number_of_registers: int, priority: Priority = Priority.SENSOR_POLL):
+        return self._execute_with_lock(address, self.comport.read_int, register, number_of_registers, priority=priority, register=register)
 
-    def write_string(self, address: int, register: int, value: str):
-        return self._execute_with_lock(address, self.comport.write_string, register, value)
+    def read_string(self, address: int, register: int, number_of_registers: int, priority: Priority = Priority.SENSOR_POLL):
+        return self._execute_with_lock(address, self.comport.read_string, register, number_of_registers, priority=priority, register=register)
 
-    def read_register(self, address: int, register: int, number_of_registers: int, functioncode: int = 1):
-        return self._execute_with_lock(address, self.comport.read_register, register, number_of_registers, functioncode)
+    def write_float(self, address: int, register: int, value: float, number_of_decimals: int = 0, priority: Priority = Priority.VFD_CONTROL):
+        return self._execute_with_lock(address, self.comport.write_float, register, value, number_of_decimals, priority=priority, functioncode=16, register=register)
+
+    def write_int(self, address: int, register: int, value: int, priority: Priority = Priority.VFD_CONTROL):
+        return self._execute_with_lock(address, self.comport.write_int, register, value, priority=priority, functioncode=16, register=register)
+
+    def write_string(self, address: int, register: int, value: str, priority: Priority = Priority.VFD_CONTROL):
+        return self._execute_with_lock(address, self.comport.write_string, register, value, priority=priority, functioncode=16, register=register)
+
+    def read_register(self, address: int, register: int, number_of_registers: int, functioncode: int = 1, priority: Priority = Priority.SENSOR_POLL):
+        return self._execute_with_lock(address, self.comport.read_register, register, number_of_registers, functioncode, priority=priority, functioncode=functioncode, register=register)
 
     def write_register(
         self, 
@@ -92,7 +213,8 @@ class SerialCom:
         value: Union[int, float], 
         number_of_decimals: int = 0, 
         functioncode: int = 16, 
-        signed: bool = False
+        signed: bool = False,
+        priority: Priority = Priority.VFD_CONTROL
     ) -> None:
         """
         Writes a value to a specified register.
@@ -103,6 +225,7 @@ class SerialCom:
         :param number_of_decimals: Number of decimals for scaling the value (default is 0).
         :param functioncode: Modbus function code to use (default is 16).
         :param signed: Whether the value is signed (default is False).
+        :param priority: Bus access class of the write (default is VFD_CONTROL).
         """
         def write_func():
             if number_of_decimals > 0:
@@ -121,15 +244,51 @@ class SerialCom:
                     functioncode=functioncode, 
                     signed=signed
                 )
-            self.logger.info(f"Successfully wrote value {value} to register {registeraddress} at address {address}.")
         
-        self._execute_with_lock(address, write_func)
+        self._execute_with_lock(address, write_func, priority=priority, functioncode=functioncode, register=registeraddress)
+
+    def read_block(self, address: int, register: int, number_of_registers: int, priority: Priority = Priority.SENSOR_POLL):
+        return self._execute_with_lock(address, self.comport.read_registers, register, number_of_registers, 3, priority=priority, register=register)
+
+    def declare_registers(self, address: int, register_map: RegisterMap):
+        """
+        Declares the registers a slave is polled for, so they can be served by read_map.
+
+        :param address: The address of the device.
+        :param register_map: The values to read from that device.
+        """
+        if register_map.count > 125:
+            raise ValueError(f"Register map for address {address} spans {register_map.count} registers, more than one read allows")
+        self.register_maps[address] = register_map
+
+    def read_map(self, address: int, priority: Priority = Priority.SENSOR_POLL) -> dict:
+        """
+        Reads every value declared for a slave in one block transaction.
 
-    def read_block(self, address: int, register: int, number_of_registers: int):
-        return self._execute_with_lock(address, self.comport.read_block, register, number_of_registers)
+        :param address: The address of the device, previously passed to declare_registers.
+        :param priority: Bus access class of the read (default is SENSOR_POLL).
+        :return: Decoded values keyed by field name.
+        """
+        register_map = self.register_maps[address]
+        registers = self.read_block(address, register_map.start, register_map.count, priority)
+        return register_map.decode(registers)
+
+    def transactions_per_second(self) -> float:
+        return self.session.transactions_per_second()
 
     def close(self):
-        self.comport.serial.close()
+        self.session.close()
         
     def __del__(self):
-        self.close()
\ No newline at end of file
+        self.close()
+
+def resolve_bus(serial_com, bus: str = DEFAULT_BUS):
+    """Picks a bus from the dict returned by SerialCom.open_buses, or passes a single SerialCom through."""
+    if isinstance(serial_com, dict):
+        try:
+            return serial_com[bus]
+        except KeyError:
+            message = f"Unknown serial bus '{bus}', declared buses are {list(serial_com)}"
+            logging.error(message)
+            raise KeyError(message) from None
+    return serial_com
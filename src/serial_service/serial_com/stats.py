@@ -0,0 +1,65 @@
+import bisect
+import threading
+import time
+
+from serial_com.trace import Outcome
+
+
+class BusStatistics:
+    """
+    Per slave and function code transaction counters with latency histograms, plus the share
+    of wall time the bus spent in transactions. Counters cover the window since the last take().
+    """
+
+    # Upper bounds of the latency buckets in seconds, a last bucket catches everything slower
+    BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.busy = 0.0
+        self.entries = {}
+
+    def record(self, address: int, functioncode: int, duration: float, outcome: Outcome):
+        bucket = bisect.bisect_left(self.BUCKETS, duration)
+        with self.lock:
+            entry = self.entries.get((address, functioncode))
+            if entry is None:
+                entry = self.entries[(address, functioncode)] = {
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "outcomes": [0] * len(Outcome),
+                    "histogram": [0] * (len(self.BUCKETS) + 1),
+                }
+            entry["count"] += 1
+            entry["total"] += duration
+            if duration > entry["max"]:
+                entry["max"] = duration
+            entry["outcomes"][outcome] += 1
+            entry["histogram"][bucket] += 1
+            self.busy += duration
+
+    def take(self) -> dict:
+        """Returns the statistics of the current window as a JSON-ready dict and starts a new window."""
+        now = time.monotonic()
+        with self.lock:
+            entries, self.entries = self.entries, {}
+            busy, self.busy = self.busy, 0.0
+            elapsed = now - self.window_start
+            self.window_start = now
+        slaves = {}
+        for (address, functioncode), entry in sorted(entries.items()):
+            slaves.setdefault(str(address), {})[str(functioncode)] = {
+                "count": entry["count"],
+                "mean_ms": round(entry["total"] / entry["count"] * 1000, 2),
+                "max_ms": round(entry["max"] * 1000, 2),
+                "outcomes": {Outcome(i).name.lower(): n for i, n in enumerate(entry["outcomes"]) if n},
+                "histogram": entry["histogram"],
+            }
+        return {
+            "window_s": round(elapsed, 2),
+            "bus_occupancy_pct": round(busy / elapsed * 100, 2) if elapsed > 0 else 0.0,
+            "histogram_bounds_ms": [b * 1000 for b in self.BUCKETS],
+            "slaves": slaves,
+        }
@@ -0,0 +1,113 @@
+import struct
+import threading
+import time
+from enum import IntEnum
+
+import minimalmodbus
+import serial
+
+
+class Outcome(IntEnum):
+    OK = 0
+    NO_RESPONSE = 1
+    INVALID_RESPONSE = 2
+    SLAVE_EXCEPTION = 3
+    SERIAL_ERROR = 4
+    OTHER_ERROR = 5
+
+
+def classify(error: Exception) -> Outcome:
+    if error is None:
+        return Outcome.OK
+    if isinstance(error, minimalmodbus.NoResponseError):
+        return Outcome.NO_RESPONSE
+    if isinstance(error, minimalmodbus.InvalidResponseError):
+        return Outcome.INVALID_RESPONSE
+    if isinstance(error, minimalmodbus.SlaveReportedException):
+        return Outcome.SLAVE_EXCEPTION
+    if isinstance(error, (serial.SerialException, OSError)):
+        return Outcome.SERIAL_ERROR
+    return Outcome.OTHER_ERROR
+
+
+class TransactionTrace:
+    """
+    Fixed-size ring of binary transaction records, cheap enough to fill on every transaction.
+
+    Each record is packed with RECORD: wall clock start time, duration in seconds,
+    slave address, function code, register and Outcome.
+    """
+
+    RECORD = struct.Struct("<dfBBHB")
+
+    def __init__(self, capacity: int = 4096, summary_interval: float = 60.0):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * self.RECORD.size)
+        self.index = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        self.summary_interval = summary_interval
+        self.summary_start = time.monotonic()
+        self.outcomes = [0] * len(Outcome)
+
+    def record(self, start: float, duration: float, address: int, functioncode: int, register: int, outcome: Outcome):
+        with self.lock:
+            self.RECORD.pack_into(
+                self.buffer, self.index * self.RECORD.size,
+                start, duration, address & 0xFF, functioncode & 0xFF, register & 0xFFFF, outcome,
+            )
+            self.index = (self.index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.outcomes[outcome] += 1
+
+    def snapshot(self) -> bytes:
+        """Records currently held, oldest first, as raw bytes."""
+        with self.lock:
+            size = self.RECORD.size
+            if self.count < self.capacity:
+                return bytes(self.buffer[:self.count * size])
+            split = self.index * size
+            return bytes(self.buffer[split:] + self.buffer[:split])
+
+    def records(self):
+        """Decoded records, oldest first."""
+        return [
+            (start, duration, address, functioncode, register, Outcome(outcome))
+            for start, duration, address, functioncode, register, outcome in self.RECORD.iter_unpack(self.snapshot())
+        ]
+
+    def dump(self, path: str, data: bytes = None) -> int:
+        """
+        Writes the held records, or a snapshot taken earlier, to path in RECORD format and
+        returns how many were written.
+        """
+        if data is None:
+            data = self.snapshot()
+        with open(path, "wb") as f:
+            f.write(data)
+        return len(data) // self.RECORD.size
+
+    @classmethod
+    def load(cls, path: str):
+        """Decodes a file written by dump."""
+        with open(path, "rb") as f:
+            data = f.read()
+        return [
+            (start, duration, address, functioncode, register, Outcome(outcome))
+            for start, duration, address, functioncode, register, outcome in cls.RECORD.iter_unpack(data)
+        ]
+
+    def take_summary(self):
+        """
+        Returns a one line summary of the outcomes since the previous summary once
+        summary_interval has passed, None otherwise.
+        """
+        now = time.monotonic()
+        elapsed = now - self.summary_start
+        if elapsed < self.summary_interval:
+            return None
+        with self.lock:
+            outcomes, self.outcomes = self.outcomes, [0] * len(Outcome)
+            self.summary_start = now
+        counts = ", ".join(f"{Outcome(i).name.lower()}: {n}" for i, n in enumerate(outcomes) if n)
+        return f"{sum(outcomes)} transactions in the last {elapsed:.0f}s ({counts or 'none'})"
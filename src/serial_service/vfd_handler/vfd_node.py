@@ -4,22 +4,25 @@ import time
 import threading
 import paho.mqtt.client as mqtt
 
-from serial_com.serial_com import SerialCom
+from serial_com.serial_com import SerialCom, DEFAULT_BUS, resolve_bus
+from serial_com.scheduler import Priority
+from telemetry_codec import encode_value
 
 
 class VFDController:
-    def __init__(self, config_file, serial_com: SerialCom):
+    startstopAddr = 8192
+    setFreqAddr = 8193
+    readFreqAddr = 8451
+    startCmd = 18
+    stopCmd = 1
+    startDec = 0
+    setFreqDec = 2
+    writeFC = 6
+    readFC = 3
+
+    def __init__(self, config_file, serial_com):
         self.load_config(config_file)
-        self.serial_com = serial_com
-        self.startstopAddr = 8192
-        self.setFreqAddr = 8193
-        self.readFreqAddr = 8451
-        self.startCmd = 18
-        self.stopCmd = 1
-        self.startDec = 0
-        self.setFreqDec = 2
-        self.writeFC = 6
-        self.readFC = 3
+        self.serial_com = resolve_bus(serial_com, self.bus)
 
         self.logger = self.setup_logger()
 
@@ -40,6 +43,8 @@ class VFDController:
 
         self.device_id = config["device_id"]
         self.address = int(config["vfd"]["address"])
+        self.bus = config["vfd"].get("bus", DEFAULT_BUS)
+        self.binary = config.get("telemetry", {}).get("encoding", "json") == "binary"
 
         # MQTT configuration
         mqtt_config = config['mqtt']
@@ -94,35 +99,32 @@ class VFDController:
     def start_vfd(self):
         try:
             self.serial_com.write_register(self.address,self.startstopAddr, self.startCmd, self.startDec, self.writeFC)
+            self.logger.info("Started VFD.")
         except Exception as e:
             self.logger.error(f"Ignored writing command: {e}")
 
-        self.logger.info("Started VFD.")
-
     def stop_vfd(self):
         try:
             self.serial_com.write_register(self.address,self.startstopAddr, self.stopCmd, self.startDec, self.writeFC)
+            self.logger.info("Stopped VFD.")
         except Exception as e:
             self.logger.error(f"Ignored writing command: {e}")
 
-        self.logger.info("Stopped VFD.")
-
     def set_frequency(self, frequency):
         try:
             self.serial_com.write_register(self.address,self.setFreqAddr, frequency, self.setFreqDec, self.writeFC)
+            self.logger.info(f"Set frequency: {frequency}")
         except Exception as e:
             self.logger.error(f"Ignored writing command: {e}")
 
-        self.logger.info(f"Set frequency: {frequency}")
-
     def emergency_stop(self):
         try:
-            self.serial_com.write_register(self.address,self.startstopAddr, self.stopCmd, self.startDec, self.writeFC)
+            self.serial_com.write_register(self.address,self.startstopAddr, self.stopCmd, self.startDec, self.writeFC, priority=Priority.EMERGENCY_STOP)
         except Exception as e:
             self.logger.error(f"Ignored writing command: {e}")
         while True:
             try:
-                speed = self.serial_com.read_register(self.address,self.readFreqAddr, 2, self.readFC)
+                speed = self.serial_com.read_register(self.address,self.readFreqAddr, 2, self.readFC, priority=Priority.EMERGENCY_STOP)
             except Exception as e:
                 self.logger.error(f"Ignored reading command: {e}")
             if speed == 0:
@@ -134,8 +136,8 @@ class VFDController:
     def publish_feedback(self):
         while True:
             try:
-                speed = self.serial_com.read_register(self.address,self.readFreqAddr, 2, self.readFC)
-                self.client.publish(f"{self.device_id}/vfd/feedback", speed)
+                speed = self.serial_com.read_register(self.address,self.readFreqAddr, 2, self.readFC, priority=Priority.VFD_FEEDBACK)
+                self.client.publish(f"{self.device_id}/vfd/feedback", encode_value(speed, self.binary))
             except Exception as e:
                 self.logger.error(f"Failed to read VFD feedback: {e}")
             time.sleep(1)
@@ -0,0 +1,25 @@
+import threading
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of the running state body. cancel() may be called from any
+    thread; a state waiting in sleep() wakes up at once instead of finishing its interval.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self):
+        self.event.set()
+
+    def reset(self):
+        self.event.clear()
+
+    def sleep(self, seconds: float) -> bool:
+        """Sleeps for seconds, returns True early if cancelled."""
+        return self.event.wait(seconds)
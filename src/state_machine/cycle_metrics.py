@@ -0,0 +1,96 @@
+import time
+import threading
+
+
+class CycleMetrics:
+    """
+    Per-cycle metrics of a cyclic test, updated with every sample of the controlled sensor
+    instead of post-processing the trace. A cycle has a high stroke towards positive_setpoint
+    and a low stroke towards negative_setpoint. A stroke counts as reached once the value has
+    covered band of the way from where the stroke started to its setpoint; rise and fall time
+    run from the stroke's start to that point, the dwell from there to the end of the stroke.
+    """
+
+    def __init__(self, band: float = 0.9):
+        self.band = band
+        self.lock = threading.Lock()
+        self.last_value = None
+        self.cycle = None
+        self.phase = None
+
+    def start(self, cycle: int, positive_setpoint: float, negative_setpoint: float):
+        with self.lock:
+            self.cycle = cycle
+            self.targets = {'high': float(positive_setpoint), 'low': float(negative_setpoint)}
+            self.strokes = {}
+            self.phase = None
+            self.peak = None
+            self.trough = None
+            self.samples = 0
+
+    def stroke(self, phase: str, now: float = None):
+        """Starts the 'high' or 'low' stroke of the current cycle, ending the previous one."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.cycle is None:
+                return
+            if self.phase is not None:
+                self.strokes[self.phase]['end'] = now
+            self.phase = phase
+            self.strokes[phase] = {
+                'start': now,
+                'end': None,
+                'start_value': self.last_value,
+                'target': self.targets[phase],
+                'reached': None,
+                'overshoot': 0.0,
+            }
+
+    def add(self, value: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.last_value = value
+            if self.phase is None:
+                return
+            self.samples += 1
+            if self.peak is None or value > self.peak:
+                self.peak = value
+            if self.trough is None or value < self.trough:
+                self.trough = value
+            stroke = self.strokes[self.phase]
+            if stroke['start_value'] is None:
+                stroke['start_value'] = value
+            distance = stroke['target'] - stroke['start_value']
+            direction = 1 if distance >= 0 else -1
+            if stroke['reached'] is None:
+                if distance == 0 or (value - stroke['start_value']) / distance >= self.band:
+                    stroke['reached'] = now
+            overshoot = (value - stroke['target']) * direction
+            if overshoot > stroke['overshoot']:
+                stroke['overshoot'] = overshoot
+
+    def finish(self, now: float = None) -> dict:
+        """Ends the cycle and returns its metrics, times in seconds, None where a stroke never reached its setpoint."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.phase is not None:
+                self.strokes[self.phase]['end'] = now
+            metrics = {
+                'cycle': self.cycle,
+                'samples': self.samples,
+                'peak': self.peak,
+                'trough': self.trough,
+            }
+            for phase, transition in (('high', 'rise_time'), ('low', 'fall_time')):
+                stroke = self.strokes.get(phase)
+                if stroke is None:
+                    metrics.update({transition: None, f'overshoot_{phase}': None, f'dwell_{phase}': None, f'{phase}_stroke': None})
+                    continue
+                reached = stroke['reached']
+                metrics[transition] = round(reached - stroke['start'], 4) if reached is not None else None
+                metrics[f'overshoot_{phase}'] = round(stroke['overshoot'], 4)
+                metrics[f'dwell_{phase}'] = round(stroke['end'] - reached, 4) if reached is not None else None
+                metrics[f'{phase}_stroke'] = round(stroke['end'] - stroke['start'], 4)
+            self.cycle = None
+            self.phase = None
+            return metrics
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import threading
+
+
+class PersistentState:
+    """
+    The resume state of the machine (variables.json), kept in memory and written behind by a
+    writer thread. Updates arriving while a write is pending are coalesced into one write.
+    Critical fields are written as soon as the writer wakes, any other update waits until
+    min_interval has passed since the last write. A write goes to a temporary file that is
+    fsync-ed and renamed over the file, a power cut leaves the old or the new state, never a
+    truncated one.
+    """
+
+    CRITICAL = frozenset(('resume', 'command', 'current_test_index', 'cycle_index'))
+
+    def __init__(self, path='variables.json', min_interval=2.0, logger=None):
+        self.path = path
+        self.min_interval = min_interval
+        self.logger = logger
+        self.data = {}
+        self.wake = threading.Condition()
+        self.dirty = False
+        self.urgent = False
+        self.closed = False
+        self.last_write = 0.0
+        self.writer = None
+
+    def load(self) -> dict:
+        """Reads the file into memory, raises FileNotFoundError or json.JSONDecodeError as json.load does."""
+        with open(self.path) as f:
+            data = json.load(f)
+        with self.wake:
+            self.data = data
+        return dict(data)
+
+    def update(self, **fields):
+        with self.wake:
+            self.data.update(fields)
+            self.dirty = True
+            if not self.CRITICAL.isdisjoint(fields):
+                self.urgent = True
+            if self.writer is None and not self.closed:
+                self.writer = threading.Thread(target=self.write_loop, name='state-writer', daemon=True)
+                self.writer.start()
+            self.wake.notify()
+
+    def write_loop(self):
+        while True:
+            with self.wake:
+                while not self.dirty and not self.closed:
+                    self.wake.wait()
+                if not self.dirty:
+                    return
+                if not self.urgent and not self.closed:
+                    delay = self.last_write + self.min_interval - time.monotonic()
+                    if delay > 0:
+                        self.wake.wait(delay)
+                        continue
+                payload = json.dumps(self.data)
+                self.dirty = False
+                self.urgent = False
+            if not self.write(payload):
+                with self.wake:
+                    if self.closed:
+                        return
+                    # Retried on the next update or once min_interval has passed
+                    self.dirty = True
+
+    def write(self, payload) -> bool:
+        tmp = f'{self.path}.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            return True
+        except OSError as e:
+            if self.logger is not None:
+                self.logger.error(f"Error writing to {self.path}: {str(e)}")
+            return False
+        finally:
+            self.last_write = time.monotonic()
+
+    def close(self):
+        """Writes any pending update and stops the writer."""
+        with self.wake:
+            self.closed = True
+            self.wake.notify()
+            writer = self.writer
+        if writer is not None and writer is not threading.current_thread():
+            writer.join()
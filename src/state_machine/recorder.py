@@ -0,0 +1,261 @@
+import os
+import json
+import mmap
+import time
+import struct
+import queue
+import shutil
+import functools
+import threading
+
+
+class Segment:
+    """
+    One preallocated, memory-mapped file of a run, laid out column by column after a
+    64-byte header: time (float64, unix seconds), value (float64), channel (uint16).
+    """
+
+    MAGIC = b"IFRC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHxxQQ")  # magic, version, capacity, count
+    HEADER_SIZE = 64
+    COUNT_OFFSET = 16
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        size = self.HEADER_SIZE + capacity * (8 + 8 + 2)
+        with open(path, "w+b") as f:
+            f.truncate(size)
+            self.map = mmap.mmap(f.fileno(), size)
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, self.VERSION, capacity, 0)
+        view = memoryview(self.map)
+        time_end = self.HEADER_SIZE + capacity * 8
+        self.times = view[self.HEADER_SIZE:time_end].cast("d")
+        self.values = view[time_end:time_end + capacity * 8].cast("d")
+        self.channels = view[time_end + capacity * 8:].cast("H")
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, t, channel, value):
+        i = self.count
+        self.times[i] = t
+        self.values[i] = value
+        self.channels[i] = channel
+        self.count = i + 1
+        # The count is written last, a reader never sees a partially written sample
+        struct.pack_into("<Q", self.map, self.COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.times.release()
+        self.values.release()
+        self.channels.release()
+        self.map.flush()
+        self.map.close()
+
+
+class Recorder:
+    """
+    Appends every sample of a test run, from open_run at the start of the test to close once
+    the machine is idle again, to memory-mapped columnar segments under <path>/<start
+    time>_<mode>/. A full segment is followed by the next one, created ahead by a background
+    thread that also writes channels.json, so record() only ever writes to memory. Before a
+    segment is created the oldest runs are deleted until all recordings fit in max_bytes.
+    Channel names are kept in the run's channels.json, the segments store their index.
+    Cycle metrics are buffered and appended to the run's cycles.jsonl by the same thread, at
+    most every cycle_flush_interval seconds and when the run is closed.
+    """
+
+    def __init__(self, path, segment_samples=100_000, max_bytes=512 * 1024 * 1024, cycle_flush_interval=5.0, logger=None):
+        self.path = path
+        self.segment_samples = segment_samples
+        self.segment_bytes = Segment.HEADER_SIZE + segment_samples * (8 + 8 + 2)
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.run_path = None
+        self.segment = None
+        self.next_segment = None
+        self.segment_number = 0
+        self.channels = {}
+        self.dropped = 0
+        self.cycle_flush_interval = cycle_flush_interval
+        self.pending_cycles = []
+        self.last_cycle_flush = time.monotonic()
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(target=self.run_jobs, name="recorder-files", daemon=True)
+        self.worker.start()
+
+    def run_jobs(self):
+        while True:
+            try:
+                job = self.jobs.get(timeout=self.cycle_flush_interval)
+            except queue.Empty:
+                job = None
+            try:
+                if job is not None:
+                    job()
+                if self.pending_cycles and time.monotonic() - self.last_cycle_flush >= self.cycle_flush_interval:
+                    self.write_cycles()
+            except Exception as e:
+                self.log("error", f"Recorder file operation failed: {e}")
+
+    def log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def open_run(self, mode, info=None):
+        """Starts recording a test run, info (the test command) is kept in the run's run.json."""
+        self.close()
+        run_path = os.path.join(self.path, f"{time.strftime('%Y%m%d-%H%M%S')}_{mode}")
+        os.makedirs(run_path, exist_ok=True)
+        with open(os.path.join(run_path, "run.json"), "w") as f:
+            json.dump(info or {}, f)
+        with self.lock:
+            self.run_path = run_path
+            self.channels = {}
+            self.segment_number = 0
+            self.dropped = 0
+        self.jobs.put(functools.partial(self.prepare_segment, run_path))
+
+    def prepare_segment(self, run_path):
+        """Creates the run's next segment, run on the background thread."""
+        with self.lock:
+            if self.run_path != run_path or self.next_segment is not None:
+                return
+            number = self.segment_number
+            self.segment_number += 1
+        if not self.make_room(run_path):
+            self.log("warning", f"Recordings exceed {self.max_bytes} bytes, {run_path} stops recording")
+            return
+        path = os.path.join(run_path, f"segment_{number:05d}.bin")
+        segment = Segment(path, self.segment_samples)
+        with self.lock:
+            if self.run_path == run_path:
+                if self.segment is None:
+                    self.segment = segment
+                    self.log("info", f"Recording to {path}")
+                    self.jobs.put(functools.partial(self.prepare_segment, run_path))
+                else:
+                    self.next_segment = segment
+                return
+        self.close_segment(segment)
+
+    def make_room(self, run_path) -> bool:
+        """Deletes the oldest other runs until a new segment fits in max_bytes, False if it cannot."""
+        runs = []
+        total = 0
+        for run in sorted((entry for entry in os.scandir(self.path) if entry.is_dir()), key=lambda entry: entry.stat().st_mtime):
+            size = sum(entry.stat().st_size for entry in os.scandir(run.path) if entry.is_file())
+            runs.append((run.path, size))
+            total += size
+        for path, size in runs:
+            if total + self.segment_bytes <= self.max_bytes:
+                break
+            if path == run_path:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.log("info", f"Deleted recording {path} to stay under {self.max_bytes} bytes")
+        return total + self.segment_bytes <= self.max_bytes
+
+    def record(self, name, value, t=None):
+        with self.lock:
+            segment = self.segment
+            if segment is None:
+                return
+            channel = self.channels.get(name)
+            if channel is None:
+                channel = self.channels[name] = len(self.channels)
+                self.jobs.put(functools.partial(self.write_channels, self.run_path, list(self.channels)))
+            if segment.full:
+                if self.next_segment is None:
+                    # The next segment is not ready yet, or the size cap is reached
+                    self.dropped += 1
+                    return
+                self.jobs.put(functools.partial(self.close_segment, segment))
+                self.segment = segment = self.next_segment
+                self.next_segment = None
+                self.jobs.put(functools.partial(self.prepare_segment, self.run_path))
+            segment.append(time.time() if t is None else t, channel, value)
+
+    def write_channels(self, run_path, names):
+        with open(os.path.join(run_path, "channels.json"), "w") as f:
+            json.dump(names, f)
+
+    def store_cycle(self, metrics):
+        """Queues one cycle's metrics for the run's cycles.jsonl, without touching the file."""
+        with self.lock:
+            if self.run_path is not None:
+                self.pending_cycles.append((self.run_path, json.dumps(metrics)))
+
+    def write_cycles(self):
+        """Appends the buffered cycle metrics to their runs' cycles.jsonl, run on the background thread."""
+        with self.lock:
+            pending, self.pending_cycles = self.pending_cycles, []
+        self.last_cycle_flush = time.monotonic()
+        runs = {}
+        for run_path, line in pending:
+            runs.setdefault(run_path, []).append(line)
+        for run_path, lines in runs.items():
+            with open(os.path.join(run_path, "cycles.jsonl"), "a") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def close_segment(self, segment):
+        """Closes a segment and deletes its file if nothing was recorded to it."""
+        segment.close()
+        if segment.count == 0:
+            os.remove(segment.path)
+
+    def close(self):
+        """Stops recording, the segments are closed on the background thread."""
+        with self.lock:
+            segments = [segment for segment in (self.segment, self.next_segment) if segment is not None]
+            self.segment = None
+            self.next_segment = None
+            self.run_path = None
+            if self.dropped:
+                self.log("warning", f"{self.dropped} samples were dropped while no segment was ready")
+        for segment in segments:
+            self.jobs.put(functools.partial(self.close_segment, segment))
+        self.jobs.put(self.write_cycles)
+
+    def flush(self):
+        """Waits until every queued file operation is done."""
+        done = threading.Event()
+        self.jobs.put(done.set)
+        done.wait()
+
+
+def load_run(run_path):
+    """
+    Loads a recorded run without copying: returns {"channels": [names], "segments": [{"time",
+    "value", "channel"}]} where each column is a read-only numpy.memmap over the segment file.
+    """
+    import numpy as np
+
+    with open(os.path.join(run_path, "channels.json")) as f:
+        channels = json.load(f)
+    segments = []
+    for name in sorted(os.listdir(run_path)):
+        if not name.startswith("segment_"):
+            continue
+        path = os.path.join(run_path, name)
+        with open(path, "rb") as f:
+            magic, version, capacity, count = Segment.HEADER.unpack(f.read(Segment.HEADER.size))
+        if magic != Segment.MAGIC or version != Segment.VERSION:
+            raise ValueError(f"{path} is not a version {Segment.VERSION} recording segment")
+        if count == 0:
+            continue
+        time_offset = Segment.HEADER_SIZE
+        value_offset = time_offset + capacity * 8
+        channel_offset = value_offset + capacity * 8
+        segments.append({
+            "time": np.memmap(path, np.float64, "r", time_offset, (count,)),
+            "value": np.memmap(path, np.float64, "r", value_offset, (count,)),
+            "channel": np.memmap(path, np.uint16, "r", channel_offset, (count,)),
+        })
+    return {"channels": channels, "segments": segments}
@@ -0,0 +1,68 @@
+import bisect
+import time
+from array import array
+
+
+class SensorHistory:
+    """
+    Fixed-size ring of (monotonic timestamp, value) samples for one sensor, backed by two
+    preallocated arrays so appending never allocates. Accessors return samples oldest first.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0  # index of the next write
+        self.size = 0
+
+    def append(self, value: float, timestamp: float = None):
+        self.times[self.head] = time.monotonic() if timestamp is None else timestamp
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def latest(self):
+        """Returns (timestamp, value) of the newest sample, or None if empty."""
+        if not self.size:
+            return None
+        i = self.head - 1
+        return self.times[i], self.values[i]
+
+    def age(self) -> float:
+        """Seconds since the newest sample, infinite if there is none."""
+        if not self.size:
+            return float('inf')
+        return time.monotonic() - self.times[self.head - 1]
+
+    def last(self, n: int):
+        """Returns (times, values) arrays of the newest n samples."""
+        n = min(n, self.size)
+        start = self.head - n
+        if start >= 0:
+            return self.times[start:self.head], self.values[start:self.head]
+        return self.times[start:] + self.times[:self.head], self.values[start:] + self.values[:self.head]
+
+    def since(self, seconds: float):
+        """Returns (times, values) arrays of the samples taken in the last seconds."""
+        cutoff = time.monotonic() - seconds
+        oldest = (self.head - self.size) % self.capacity
+        # The ring is sorted by time from oldest to newest, possibly wrapping around the end
+        if oldest + self.size <= self.capacity:
+            count = oldest + self.size - bisect.bisect_left(self.times, cutoff, oldest, oldest + self.size)
+        elif self.times[self.capacity - 1] >= cutoff:
+            count = self.capacity - bisect.bisect_left(self.times, cutoff, oldest, self.capacity) + self.head
+        else:
+            count = self.head - bisect.bisect_left(self.times, cutoff, 0, self.head)
+        return self.last(count)
+
+    def rate(self, seconds: float) -> float:
+        """Average change per second over the last seconds, 0 with fewer than two samples."""
+        times, values = self.since(seconds)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (values[-1] - values[0]) / (times[-1] - times[0])
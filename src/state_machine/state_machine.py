@@ -4,8 +4,9 @@ from logging.handlers import RotatingFileHandler
 import paho.mqtt.client as mqtt
 import time
 import json
-import copy
 import threading
+import queue
+import functools
 import traceback
 import os
 from logging.handlers import RotatingFileHandler
@@ -17,6 +18,13 @@ from states.holding_time import HoldingTimeState
 from states.automatic_cycling import AutomaticCyclingState
 from states.stopping import StoppingState
 from states.relief import ReliefValvesState
+from states.transitions import Event, TransitionTable, RECOVERY, make_event
+from sensor_history import SensorHistory
+from telemetry_codec import decode_value, decode_reading, decode_quality, decode_frame, decode_valves, is_binary, GOOD, STALE, FAILED, ESTIMATED, QUALITY_NAMES
+from recorder import Recorder
+from cycle_metrics import CycleMetrics
+from cancellation import CancelToken
+from persistent_state import PersistentState
 
 
 class StateMachine:
@@ -52,7 +60,9 @@ class StateMachine:
 
         self.current_user_inputs = None
         self.current_event = None
-        self.trigger_event_flag = False
+        # (enqueue time, event) in arrival order, None wakes state_loop up to exit
+        self.events = queue.Queue()
+        self.event_latency = {'count': 0, 'total': 0.0, 'max': 0.0, 'last': 0.0}
         self.freq_command = 0
         self.broker_address = config['mqtt']['broker_host']
         self.broker_port = config['mqtt']['broker_port']
@@ -71,7 +81,9 @@ class StateMachine:
             "stopping": StoppingState(self),
             "relief": ReliefValvesState(self)
         }
-        self.current_state = self.states["idle"]
+        self.state_name = "idle"
+        self.current_state = self.states[self.state_name]
+        self.transitions = TransitionTable()
 
         # Initialize sensors and valves from config
         self.sensors = config.get('sensors', [])
@@ -81,11 +93,50 @@ class StateMachine:
         self.retry_interval = 5  # seconds
         self.retry_attempts = 3
         
+        self.routes = {}
         self.sensors_values = {}
+        self.sensor_id = None
+        self.cycle_metrics = CycleMetrics()
+        self.history_capacity = config.get('telemetry', {}).get('history_capacity', 1024)
+        self.sensor_history = {
+            str(sensor['address']): SensorHistory(self.history_capacity) for sensor in self.sensors
+        }
+        # Sensors publish on change or at least every heartbeat seconds, silence beyond that means stale data
+        self.sensor_heartbeat = {
+            str(sensor['address']): float(sensor.get('heartbeat', 1.0)) for sensor in self.sensors
+        }
+        self.stale_heartbeats = config.get('telemetry', {}).get('stale_heartbeats', 2)
+        # Controllers act only on readings of good (or estimated) quality no older than max_age seconds
+        self.max_sample_age = config.get('telemetry', {}).get('max_age', 0.5)
+        self.sensor_quality_codes = {}
+        self.sensor_reported_age = {}
+        # (quality, age) last published on {device_id}/sensors/<address>/quality, applies to the JSON readings that follow
+        self.sensor_published_quality = {}
+        self.sensor_received = {}
+        self.sensor_frame_seq = 0
+        self.sensor_frame_time = 0.0
+        recorder_config = config.get('recorder', {})
+        self.recorder = None
+        if recorder_config.get('enabled', False):
+            self.recorder = Recorder(
+                recorder_config.get('path', 'logs/recordings'),
+                recorder_config.get('segment_samples', 100_000),
+                recorder_config.get('max_bytes', 512 * 1024 * 1024),
+                recorder_config.get('cycle_flush_interval', 5.0),
+                self.logger,
+            )
+        persistence_config = config.get('persistence', {})
+        self.variables = PersistentState(
+            persistence_config.get('path', 'variables.json'),
+            persistence_config.get('min_interval', 2.0),
+            self.logger,
+        )
         self.valve_status = {}
         self.vdf_feedback = 0
         self.action = ''
-        self.force_stop = False
+        # Tripped by emergency_stop, state bodies check it and sleep on it instead of polling a flag
+        self.cancel = CancelToken()
+        # The state worker: runs state_loop, the only thread that executes state bodies
         self.task = None
 
         self.cyclic_mode = False
@@ -105,48 +156,29 @@ class StateMachine:
         self.retrieve_variables()
         
     def store_variables(self,resume=None, command=None, current_test_index=None, cycle_index=None, current_inputs=None):
-        # Load existing data
-        try:
-            with open('variables.json', 'r') as file:
-                data = json.load(file)
-        except FileNotFoundError:
-            data = {}
-        except json.JSONDecodeError:
-            self.logger.error("Error decoding JSON from variables file.")
-            data = {}
-
-        # Update with new values
+        """Updates the resume state in memory, self.variables writes it behind to variables.json."""
+        fields = {}
         if resume is not None:
-            data['resume'] = resume
+            fields['resume'] = resume
         if command is not None:
-            data['command'] = command
+            fields['command'] = command
         if current_test_index is not None:
-            data['current_test_index'] = current_test_index
+            fields['current_test_index'] = current_test_index
         if cycle_index is not None:
-            data['cycle_index'] = cycle_index
+            fields['cycle_index'] = cycle_index
         if current_inputs is not None:
-            data['current_inputs'] = current_inputs
-        
+            fields['current_inputs'] = current_inputs
+        self.variables.update(**fields)
 
-        # Write back to file
-        try:
-            with open('variables.json', 'w') as file:
-                json.dump(data, file)
-        except Exception as e:
-            self.logger.error(f"Error writing to variables file: {str(e)}")
-        
-        
-        
     def retrieve_variables(self):
         try:
-            with open('variables.json', 'r') as file:
-                data = json.load(file)
-                self.cyclic_resume =  data['resume']
-                self.resume_command =  data['command']
-                self.current_test_index =  int(data['current_test_index'])
-                self.cycle_index =  int(data['cycle_index'])
-                self.current_user_inputs = data['current_inputs']
-                return data
+            data = self.variables.load()
+            self.cyclic_resume =  data['resume']
+            self.resume_command =  data['command']
+            self.current_test_index =  int(data['current_test_index'])
+            self.cycle_index =  int(data['cycle_index'])
+            self.current_user_inputs = data['current_inputs']
+            return data
         except FileNotFoundError:
             self.logger.warning("variables.json file not found.")
             return {}
@@ -162,30 +194,20 @@ class StateMachine:
         try:
             if rc == 0:
                 self.logger.info("Connected to MQTT broker")
-                self.client.subscribe(f'{self.device_id}/command')
-                self.client.subscribe(f'{self.device_id}/resume_cancel')
-                self.client.subscribe(f'{self.device_id}/vfd/command')
-                self.client.subscribe(f'{self.device_id}/emergency_stop')
-                self.client.subscribe(f'{self.device_id}/current_input')
-                self.logger.info(f'subscribed to command topics')
-                
-                for sensor in self.sensors:
-                    topic = f"{self.device_id}/sensors/{sensor['address']}"
-                    self.logger.info(f'subscribed to {topic}')
+                self.build_routes()
+                for topic in self.routes:
                     self.client.subscribe(topic)
-                    
-                self.client.subscribe(f"{self.device_id}/valves/status")
+                    self.logger.info(f'subscribed to {topic}')
+                self.publish_state()
                 
-                vdf_topic = f"{self.device_id}/vfd/feedback"
-                self.client.subscribe(vdf_topic)
                 self.feedback_loop.start()
-                self.current_state.on_enter()
+                if self.task is None:
+                    self.task = threading.Thread(target=self.state_loop, name='state-worker')
+                    self.task.start()
+                # The state body may block, never run it on the network thread
+                self.run_on_worker(self.current_state.on_enter)
                 if self.cyclic_resume:
                     self.current_status = f'resume cycle {self.cycle_index}'
-                    
-                if self.task is None: 
-                    self.task = threading.Thread(target=self.state_loop)
-                    self.task.start()
             else:
                 self.logger.error(f"Failed to connect to MQTT broker with return code: {rc}")
                 self.retry_connect()
@@ -196,13 +218,18 @@ class StateMachine:
 
     def on_disconnect(self, client, userdata, rc,prop,d):
         self.logger.warning("Disconnected from MQTT broker")
-        self.force_stop = True
+        self.cancel.cancel()
         self.exit = True
+        self.events.put(None)
+        if self.recorder is not None:
+            self.recorder.close()
         try:
             if self.task is not None: self.task.join()
             if self.feedback_loop is not None: self.feedback_loop.join()
         except Exception as e:
             self.logger.error(f"No threads to join: {str(e)}")
+        # After the state worker is done, so the last checkpoint of an interrupted run is written
+        self.variables.close()
         # self.retry_connect()
 
     def retry_connect(self):
@@ -219,9 +246,14 @@ class StateMachine:
         self.logger.error("Exceeded maximum retry attempts. Exiting...")
         exit(1)
         
+    def publish_state(self):
+        """Publishes the state name, retained, on {device_id}/state whenever it changes."""
+        self.client.publish(f'{self.device_id}/state', self.state_name, retain=True)
+
     def publish_status(self):
         self.client.publish(f'{self.device_id}/status',self.current_status)
         self.client.publish(f'{self.device_id}/current_test_index',self.current_test_index)
+        self.client.publish(f'{self.device_id}/cycle_index',self.cycle_index)
         if self.cyclic_resume:
             self.client.publish(
                 f'{self.device_id}/resume_status',
@@ -239,247 +271,333 @@ class StateMachine:
                 )
             )
         
+    def build_routes(self):
+        """Maps every subscribed topic to its handler once, on_message then does a single dict lookup."""
+        device = self.device_id
+        self.routes = {
+            f'{device}/command': self.on_command,
+            f'{device}/resume_cancel': self.on_resume_cancel,
+            f'{device}/vfd/command': self.on_vfd_command,
+            f'{device}/emergency_stop': self.on_emergency_stop,
+            f'{device}/current_input': self.on_current_input,
+            f'{device}/sensors/frame': self.on_sensor_frame_message,
+            f'{device}/vfd/feedback': self.on_vfd_feedback,
+            f'{device}/valves/status': self.on_valve_status,
+        }
+        for sensor in self.sensors:
+            address = str(sensor['address'])
+            self.routes[f'{device}/sensors/{address}'] = functools.partial(self.on_sensor_reading, address)
+            self.routes[f'{device}/sensors/{address}/quality'] = functools.partial(self.on_sensor_quality, address)
+        self.valve_names = [valve['name'] for valve in self.valves]
+
     def on_message(self, client, userdata, message):
         try:
-            topic_base, topic_name = self.get_topic_parts(message.topic)
-            self.logger.debug(f"Received message on topic: {message.topic}")
-            
-            if message.topic == f'{self.device_id}/vfd/command':
-                x = json.loads(message.payload.decode())
-                if x['command'] == 'set_frequency':
-                    self.freq_command = float(x['parameter'])
-            elif topic_name == 'command':
-                event = json.loads(message.payload.decode())
-                self.current_event = event
-                self.trigger_event_flag = True
-                
-            elif topic_name == 'resume_cancel':
-                self.test_index_wanted = None
-                self.cyclic_resume = False
-                self.cycle_index = 0
-                self.current_status = 'idle'
-                self.store_variables(resume=self.cyclic_resume,command={},current_test_index=self.current_test_index,cycle_index=self.cycle_index)
-                
-            elif topic_name == 'emergency_stop': 
-                self.client.publish(
-                    f'{self.device_id}/vfd/command',
-                    json.dumps(
-                        {
-                            "command":"emergency_stop",
-                            "parameter": ""
-                        }
-                    )
-                )
-                self.force_stop = True
-                
-            elif topic_base == f'{self.device_id}/sensors':
-                self.sensors_values[topic_name] = float(message.payload.decode())
-            elif message.topic == f'{self.device_id}/vfd/feedback':
-                self.vdf_feedback = float(message.payload.decode())
-            elif message.topic == f'{self.device_id}/valves/status':
-                data = json.loads(message.payload.decode())
-                self.valve_status = {i:int(data[i]) for i in data}
-            elif message.topic == f'{self.device_id}/current_input':
-                data = json.loads(message.payload.decode())
-                self.current_user_inputs = data
-                self.store_variables(current_inputs=data)
+            handler = self.routes.get(message.topic)
+            if handler is not None:
+                handler(message.payload)
         except json.JSONDecodeError:
             self.logger.error(f"Error decoding JSON from message on topic {message.topic}")
         except Exception as e:
             self.logger.error(f"Unexpected error processing message on topic {message.topic}: {str(e)}")
             self.logger.error(traceback.format_exc())
-            
-        
-    def get_topic_parts(self,topic):
-        # Split the topic string by "/"
-        topic_parts = topic.split("/")
-        
-        # Extract the base portion
-        topic_base = "/".join(topic_parts[:-1])
-        
-        return topic_base , topic_parts[-1]
-    
-    def trigger_event(self, event:dict): 
-
-        if isinstance(self.current_state, IdleState):
-            self.force_stop = False
-            if event['command'] == "start":
-                self.logger.info(event)
-                if event.get('custom_preset') == 'preset' :
-                    if event['mode'] == 'manual': 
-                        self.cyclic_mode = False
-                        
-                        self.mode = event['mode']
-                        self.sensor_id = event['sensor_id']
-                        self.setpoint = event['setpoint']
-                        self.holdtime = event['holdtime']
-                        
-                        self.current_state.on_exit()
-                        self.current_state = self.states["initializing_valves"]
-                        self.action = 'positive' if self.setpoint > self.sensors_values[self.sensor_id] else 'negative'
-                        self.current_state.on_enter()
-                        
-                        n_event = copy.deepcopy(event) 
-                        n_event['command'] = 'turn_on'
-                        self.current_event = n_event
-                        self.trigger_event_flag = True
-                        # self.trigger_event(n_event)
-                    elif event['mode'] == 'cyclic':
-                        self.cyclic_mode = True
-                        self.logger.info(f'Command Test index: {event["test_index"]}')
-                        self.test_index_wanted = event['test_index'] if 'test_index' in event else 0
-                        self.store_variables(command=event)
-                        
-                        self.mode = event['mode']
-                        self.sensor_id =event['sensor_id']
-                        self.cycle_counter = int(event['cycles'])
-                        self.positive_setpoint = float(event['positive'])
-                        self.negative_setpoint = float(event['negative'])
-                        p1 = float(self.positive_setpoint)
-                        p2 = float(self.negative_setpoint)
-                        direction = p1 > p2
-                        self.logger.info(f'{p1} > {p2} = {direction}')
-
-                        self.action = 'positive' if direction else 'negative'
-                        self.current_state.on_exit()
-                        self.current_state = self.states["initializing_valves"]
-                        self.current_state.on_enter()
-                        n_event = copy.deepcopy(event) 
-                        n_event['command'] = 'turn_on'
-                        self.current_event = n_event
-                        self.trigger_event_flag = True
-                        # self.trigger_event(n_event)
-
-                else:
-                    if event['mode'] == 'manual': 
-                        self.cyclic_mode = False
-                        
-                        self.mode = event['mode']
-                        self.sensor_id = event['sensor_id']
-                        self.setpoint = event['setpoint']
-                        self.holdtime = event['holdtime']
-                        
-                        self.current_state.on_exit()
-                        self.current_state = self.states["initializing_valves"]
-                        self.action = 'positive' if self.setpoint > self.sensors_values[self.sensor_id] else 'negative'
-                        self.current_state.on_enter()
-                        
-                        n_event = copy.deepcopy(event) 
-                        n_event['command'] = 'turn_on'
-                        self.current_event = n_event
-                        self.trigger_event_flag = True
-                        # self.trigger_event(n_event)
-                    elif event['mode'] == 'cyclic':
-                        self.cyclic_mode = True
-                        self.logger.info(f'Command Test index: {event["test_index"]}')
-                        self.test_index_wanted = event['test_index'] if 'test_index' in event else 0
-                        self.store_variables(command=event)
-                        
-                        self.mode = event['mode']
-                        self.sensor_id =event['sensor_id']
-                        self.cycle_counter = int(event['cycles'])
-                        self.positive_setpoint = float(event['positive'])
-                        self.negative_setpoint = float(event['negative'])
-                        p1 = float(self.positive_setpoint)
-                        p2 = float(self.negative_setpoint)
-                        direction = p1 > p2
-                        self.logger.info(f'{p1} > {p2} = {direction}')
-
-                        self.action = 'positive' if direction else 'negative'
-                        self.current_state.on_exit()
-                        self.current_state = self.states["initializing_valves"]
-                        self.current_state.on_enter()
-                        n_event = copy.deepcopy(event) 
-                        n_event['command'] = 'turn_on'
-                        self.current_event = n_event
-                        self.trigger_event_flag = True
-                        # self.trigger_event(n_event)
-
-        elif isinstance(self.current_state, InitializeState):
-            if event['command'] == "turn_on":
-                self.current_state.on_exit()
-                self.current_state = self.states["start_vdf"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'automatic' if self.cyclic_mode else 'hold'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-                
 
-        elif isinstance(self.current_state, StartVDFState):
-            if event['command'] == "hold":
-                self.current_state.on_exit()
-                self.current_state = self.states["holding_time"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'relief'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-            elif event['command'] == "automatic":
-                self.current_state.on_exit()
-                self.current_state = self.states["automatic_cycling"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'relief'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-
-        elif isinstance(self.current_state, HoldingTimeState):
-            if event['command'] == "relief":
-                self.current_state.on_exit()
-                self.current_state = self.states["relief"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'turn_off'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-
-        elif isinstance(self.current_state, AutomaticCyclingState):
-            if event['command'] == "relief":
-                self.current_state.on_exit()
-                self.current_state = self.states["relief"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'turn_off'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-
-        elif isinstance(self.current_state, ReliefValvesState):
-            if event['command'] == "turn_off":
-                self.current_state.on_exit()
-                self.current_state = self.states["stopping"]
-                self.current_state.on_enter()
-                n_event = copy.deepcopy(event) 
-                n_event['command'] = 'idle'
-                self.current_event = n_event
-                self.trigger_event_flag = True
-                # self.trigger_event(n_event)
-                
-        elif isinstance(self.current_state, StoppingState):
-            if event['command'] == "idle":
-                self.cyclic_mode = False
-                self.current_state.on_exit()
-                self.current_state = self.states["idle"]
-                self.current_state.on_enter()
+    def on_vfd_command(self, payload):
+        x = json.loads(payload)
+        if x['command'] == 'set_frequency':
+            self.freq_command = float(x['parameter'])
+
+    def on_command(self, payload):
+        event = json.loads(payload)
+        self.post_event(make_event(event['command'], event))
+
+    def on_resume_cancel(self, payload):
+        self.test_index_wanted = None
+        self.cyclic_resume = False
+        self.cycle_index = 0
+        self.current_status = 'idle'
+        self.store_variables(resume=self.cyclic_resume,command={},current_test_index=self.current_test_index,cycle_index=self.cycle_index)
+
+    def on_emergency_stop(self, payload):
+        self.cancel.cancel()
+        self.client.publish(
+            f'{self.device_id}/vfd/command',
+            json.dumps(
+                {
+                    "command":"emergency_stop",
+                    "parameter": ""
+                }
+            )
+        )
+
+    def on_sensor_frame_message(self, payload):
+        self.on_sensor_frame(decode_frame(payload))
+
+    def on_sensor_reading(self, address, payload):
+        value, quality, age = decode_reading(payload)
+        if not is_binary(payload):
+            quality, age = self.sensor_published_quality.get(address, (GOOD, 0.0))
+        self.store_sensor_value(address, value, quality, age)
+
+    def on_sensor_quality(self, address, payload):
+        self.sensor_published_quality[address] = decode_quality(payload)
+
+    def on_vfd_feedback(self, payload):
+        self.vdf_feedback = decode_value(payload)
+        self.record('vfd/feedback', self.vdf_feedback)
+
+    def on_valve_status(self, payload):
+        valve_status = decode_valves(payload, self.valve_names)
+        for name, state in valve_status.items():
+            if self.valve_status.get(name) != state:
+                self.record(f'valves/{name}', state)
+        self.valve_status = valve_status
+
+    def on_current_input(self, payload):
+        data = json.loads(payload)
+        self.current_user_inputs = data
+        self.store_variables(current_inputs=data)
+
+    def store_sensor_value(self, address, value, quality=GOOD, age=0.0, now=None):
+        """
+        Stores a reading with its quality, age is how old the value already was when published.
+        Only good and estimated values are new samples, stale and failed ones repeat the last value.
+        """
+        now = time.monotonic() if now is None else now
+        self.sensors_values[address] = value
+        self.sensor_quality_codes[address] = quality
+        self.sensor_reported_age[address] = age
+        self.sensor_received[address] = now
+        if quality in (GOOD, ESTIMATED):
+            self.history(address).append(value, now)
+            self.record(f'sensors/{address}', value)
+            if address == self.sensor_id:
+                self.cycle_metrics.add(value, now)
+
+    def record(self, channel, value):
+        """Appends a sample to the recording of the running test, nothing is recorded while idle."""
+        if self.recorder is not None:
+            self.recorder.record(channel, value)
+
+    def publish_cycle_metrics(self, metrics):
+        """Publishes a finished cycle's metrics on {device_id}/cycle_metrics and stores them with the run."""
+        # current_test_index only advances once the test is done, tag with the test being run
+        metrics['test_index'] = self.test_index_wanted if self.test_index_wanted is not None else self.current_test_index
+        command = self.current_event.payload if self.current_event is not None else {}
+        if 'test_index' in command and command['test_index'] != metrics['test_index']:
+            self.logger.error(f"Cycle metrics tagged with test {metrics['test_index']} while running test {command['test_index']}")
+        self.client.publish(f'{self.device_id}/cycle_metrics', json.dumps(metrics))
+        if self.recorder is not None:
+            self.recorder.store_cycle(metrics)
+
+    def history(self, address) -> SensorHistory:
+        """Returns the sample history of a sensor, e.g. self.history(self.sensor_id).since(1.0)."""
+        address = str(address)
+        history = self.sensor_history.get(address)
+        if history is None:
+            history = self.sensor_history[address] = SensorHistory(self.history_capacity)
+        return history
+
+    def sensor_stale(self, address) -> bool:
+        """True if the sensor missed its heartbeats; an unchanged value that is still heartbeating is not stale."""
+        address = str(address)
+        received = self.sensor_received.get(address)
+        if received is None:
+            return True
+        return time.monotonic() - received > self.stale_heartbeats * self.sensor_heartbeat.get(address, 1.0)
+
+    def sensor_quality(self, address) -> int:
+        """The quality reported with the last reading, STALE if the sensor went silent since."""
+        address = str(address)
+        quality = self.sensor_quality_codes.get(address, STALE)
+        if quality != FAILED and self.sensor_stale(address):
+            return STALE
+        return quality
+
+    def sensor_age(self, address) -> float:
+        """
+        Age of the last published value when it was published, infinite if none arrived yet.
+        With a deadband an unchanged value is not republished, so time since the last message
+        is covered by sensor_stale instead.
+        """
+        return self.sensor_reported_age.get(str(address), float('inf'))
+
+    def sensor_fresh(self, address, max_age=None) -> bool:
+        """True if the sensor reports good (or estimated) values, keeps heartbeating and its last value was fresh."""
+        max_age = self.max_sample_age if max_age is None else max_age
+        return self.sensor_quality(address) in (GOOD, ESTIMATED) and self.sensor_age(address) <= max_age
+
+    def wait_for_fresh(self, address, max_age=None, timeout=1.0) -> bool:
+        """Waits until the sensor has a fresh value, returns False on timeout or cancellation."""
+        deadline = time.monotonic() + timeout
+        while not self.sensor_fresh(address, max_age):
+            if time.monotonic() >= deadline or self.cancel.sleep(0.01):
+                return False
+        return True
+
+    def publish_sensor_quality(self):
+        """Publishes the quality and age of every sensor on {device_id}/sensors/quality."""
+        report = {}
+        now = time.monotonic()
+        for address in self.sensor_heartbeat:
+            age = self.sensor_age(address)
+            received = self.sensor_received.get(address)
+            report[address] = {
+                'quality': QUALITY_NAMES[self.sensor_quality(address)],
+                'age': round(age, 3) if age != float('inf') else None,
+                'since_message': round(now - received, 3) if received is not None else None,
+            }
+        self.client.publish(f'{self.device_id}/sensors/quality', json.dumps(report))
+
+    def on_sensor_frame(self, frame):
+        """Applies every reading of one frame at once, a frame holds at most one reading per sensor."""
+        if frame['seq'] > self.sensor_frame_seq + 1 and self.sensor_frame_seq:
+            self.logger.debug(f"Lost {frame['seq'] - self.sensor_frame_seq - 1} sensor frames")
+        now = time.monotonic()
+        for address, value in frame['values'].items():
+            self.store_sensor_value(address, value, frame['quality'][address], frame['age'][address], now)
+        self.sensor_frame_seq = frame['seq']
+        self.sensor_frame_time = frame['t']
+
+    def configure_test(self, event):
+        """Action of the start transition, takes the test parameters from the command."""
+        command = event.payload
+        self.logger.info(dict(command))
+        self.mode = command['mode']
+        self.sensor_id = command['sensor_id']
+        if command['mode'] == 'manual':
+            self.cyclic_mode = False
+            self.setpoint = command['setpoint']
+            self.holdtime = command['holdtime']
+            self.action = 'positive' if self.setpoint > self.sensors_values[self.sensor_id] else 'negative'
+        elif command['mode'] == 'cyclic':
+            self.cyclic_mode = True
+            self.logger.info(f'Command Test index: {command["test_index"]}')
+            self.test_index_wanted = command['test_index'] if 'test_index' in command else 0
+            self.store_variables(command=dict(command))
+            self.cycle_counter = int(command['cycles'])
+            self.positive_setpoint = float(command['positive'])
+            self.negative_setpoint = float(command['negative'])
+            p1 = float(self.positive_setpoint)
+            p2 = float(self.negative_setpoint)
+            direction = p1 > p2
+            self.logger.info(f'{p1} > {p2} = {direction}')
+            self.action = 'positive' if direction else 'negative'
+        else:
+            raise ValueError(f"Unknown test mode {command['mode']}")
+        if self.recorder is not None:
+            self.recorder.open_run(command['mode'], dict(command))
+
+    def end_test(self, event):
+        """Action of the transition back to idle."""
+        self.cyclic_mode = False
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def trigger_event(self, event: Event):
+        if self.state_name == 'idle':
+            self.cancel.reset()
+        transition = self.transitions.lookup(self.state_name, event.command)
+        if transition is None:
+            self.logger.debug(f"Ignoring {event.command} in state {self.state_name}")
+            return
+        if transition.action is not None:
+            getattr(self, transition.action)(event)
+        self.current_state.on_exit()
+        self.state_name = transition.next_state
+        self.current_state = self.states[self.state_name]
+        self.publish_state()
+        self.current_state.on_enter()
+        follow_up = transition.follow_up(self) if callable(transition.follow_up) else transition.follow_up
+        if follow_up is not None:
+            self.post_event(Event(follow_up, event.payload))
 
     def pub_feedback(self):
         while not self.exit:
             self.publish_status()
+            self.publish_sensor_quality()
             time.sleep(0.3)
             
                     
                     
+    def post_event(self, event: Event):
+        """Queues an event for state_loop, events are handled one by one in arrival order."""
+        self.events.put((time.monotonic(), event))
+
+    def run_on_worker(self, work):
+        """Queues a callable to run on the state worker, in order with the events."""
+        self.events.put((time.monotonic(), work))
+
     def state_loop(self):
         while not self.exit:
-            if self.trigger_event_flag and self.current_event is not None:
-                self.trigger_event_flag = False
-                self.trigger_event(self.current_event)
-            time.sleep(0.01)
+            item = self.events.get()
+            if item is None:
+                break
+            enqueued, event = item
+            if not isinstance(event, Event):
+                try:
+                    event()
+                except Exception as e:
+                    self.logger.error(f"Error running {event} on the state worker: {str(e)}")
+                    self.logger.error(traceback.format_exc())
+                continue
+            latency = time.monotonic() - enqueued
+            self.event_latency['count'] += 1
+            self.event_latency['total'] += latency
+            self.event_latency['last'] = latency
+            self.event_latency['max'] = max(self.event_latency['max'], latency)
+            self.logger.debug(f"Handling {event.command} {latency * 1000:.2f} ms after it was queued")
+            self.current_event = event
+            try:
+                self.trigger_event(event)
+            except Exception as e:
+                self.logger.error(f"Error handling event {event}: {str(e)}")
+                self.logger.error(traceback.format_exc())
+                self.recover(event, e)
+            self.publish_event_latency()
+
+    def recover(self, event: Event, error: Exception):
+        """
+        Brings the machine to a safe state after a failed transition: trips the cancellation
+        token and enters the next state of RECOVERY past the current one, whose command then
+        continues down the path as usual. A failure in idle leaves the machine idle.
+        """
+        states = [state for state, _ in RECOVERY]
+        if self.state_name == 'idle':
+            self.current_status = f'error: {error}'
+            return
+        self.cancel.cancel()
+        step = states.index(self.state_name) + 1 if self.state_name in states else 0
+        state, follow_up = RECOVERY[step]
+        self.logger.warning(f"Recovering from {self.state_name} through {state}")
+        self.state_name = state
+        self.current_state = self.states[state]
+        self.publish_state()
+        if state == 'idle':
+            self.end_test(event)
+        try:
+            self.current_state.on_enter()
+        except Exception as e:
+            self.logger.error(f"Error entering {state} while recovering: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            self.recover(event, e)
+            return
+        if follow_up is not None:
+            self.post_event(Event(follow_up, event.payload))
+        self.current_status = f'error: {error}'
+
+    def publish_event_latency(self):
+        """Publishes enqueue-to-handle latency of state machine events on {device_id}/diagnostics/events."""
+        stats = self.event_latency
+        self.client.publish(
+            f'{self.device_id}/diagnostics/events',
+            json.dumps({
+                'count': stats['count'],
+                'last_ms': round(stats['last'] * 1000, 3),
+                'mean_ms': round(stats['total'] / stats['count'] * 1000, 3),
+                'max_ms': round(stats['max'] * 1000, 3),
+                'pending': self.events.qsize(),
+            })
+        )
                 
                 
     def run(self):
@@ -505,5 +623,6 @@ class StateMachine:
             self.exit = True
             self.client.disconnect()
         finally:
+            self.variables.close()
             self.logger.info("Disconnected from MQTT broker")
 
@@ -1,6 +1,6 @@
 from states.state import State
-import time
 import json
+from telemetry_codec import QUALITY_NAMES
 
 class AutomaticCyclingState(State):
     def on_enter(self):
@@ -10,7 +10,11 @@ class AutomaticCyclingState(State):
         self.machine.store_variables(resume=True)
         
         self.setpoint = max(abs(float(self.machine.positive_setpoint)),abs(float(self.machine.negative_setpoint)))
-        while not self.machine.force_stop:
+        while not self.machine.cancel.cancelled:
+            # Ramping the VFD on a frozen value would overshoot, hold the frequency until the sensor is fresh again
+            if not self.machine.wait_for_fresh(self.machine.sensor_id, timeout=1.0):
+                self.machine.logger.warning(f"Sensor {self.machine.sensor_id} is {QUALITY_NAMES[self.machine.sensor_quality(self.machine.sensor_id)]}, waiting for fresh data")
+                continue
             self.error =  abs(self.machine.sensors_values[self.machine.sensor_id]) - abs(self.setpoint) 
             self.abs_error = abs(self.error)
             if self.machine.freq_command - self.machine.vdf_feedback < 0.3:
@@ -28,26 +32,29 @@ class AutomaticCyclingState(State):
                 
             if self.error >= 0 :
                 break
-            time.sleep(1)
+            self.machine.cancel.sleep(1)
                 
     def on_exit(self):
         super().on_exit()
         for i in range(self.machine.cycle_index,self.machine.cycle_counter):
             
-            if self.machine.force_stop : return
+            if self.machine.cancel.cancelled : return
+            self.machine.cycle_index = i
             self.machine.store_variables(cycle_index=i)    
+            self.machine.cycle_metrics.start(i, self.machine.positive_setpoint, self.machine.negative_setpoint)
                                 
             if self.machine.action == 'positive':
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     self.machine.current_status = f'Cycle {i+1} High Stroke'
+                    self.machine.cycle_metrics.stroke('high')
                     # if self.machine.sensors_values[self.machine.sensor_id] >= float(self.machine.positive_setpoint) * 0.9 :
                     if True: # modif
                         for valve in self.machine.valves:
                             if "POSITIVE_RELEASE" in valve['role']:
                                 self.machine.client.publish(f'{self.machine.device_id}/valves/{valve["name"]}',0) # off // release
-                        time.sleep(0.8) # modif
+                        self.machine.cancel.sleep(0.8) # modif
                         break
-                    time.sleep(0.02)
+                    self.machine.cancel.sleep(0.02)
                     
                     
                 #####################
@@ -56,53 +63,59 @@ class AutomaticCyclingState(State):
                 #####################
                 
                 
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     self.machine.current_status = f'Cycle {i+1} Low Stroke'
+                    self.machine.cycle_metrics.stroke('low')
                     # if self.machine.sensors_values[self.machine.sensor_id] <= float(self.machine.negative_setpoint) * 1.1:
                     if True: # modif
                         for valve in self.machine.valves:
                             if "POSITIVE_RELEASE" in valve['role']:
                                 self.machine.client.publish(f'{self.machine.device_id}/valves/{valve["name"]}',1) # on // pump
-                        time.sleep(0.8) # modif
+                        self.machine.cancel.sleep(0.8) # modif
                         break
-                    time.sleep(0.02)
+                    self.machine.cancel.sleep(0.02)
             else:
                 
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     self.machine.current_status = f'Cycle {i+1} High Stroke'
+                    self.machine.cycle_metrics.stroke('high')
                     # if self.machine.sensors_values[self.machine.sensor_id] <= float(self.machine.positive_setpoint) * 0.9:
                     if True: # modif
                         for valve in self.machine.valves:
                             if "NEGATIVE_RELEASE" in valve['role']:
                                 self.machine.client.publish(f'{self.machine.device_id}/valves/{valve["name"]}',0) # on // release
-                        time.sleep(0.8) # modif
+                        self.machine.cancel.sleep(0.8) # modif
                         break
-                    time.sleep(0.02)
+                    self.machine.cancel.sleep(0.02)
                 
                 #####################
                 # if self.machine.sensors_values[self.machine.sensor_id] >= float(self.machine.positive_setpoint) * 0.9:
                 #     break
                 #####################
                     
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     self.machine.current_status = f'Cycle {i+1} Low Stroke'
+                    self.machine.cycle_metrics.stroke('low')
                     # if self.machine.sensors_values[self.machine.sensor_id] >= float(self.machine.negative_setpoint) * 1.1:
                     if True: # modif
                         for valve in self.machine.valves:
                             if "NEGATIVE_RELEASE" in valve['role']:
                                 self.machine.client.publish(f'{self.machine.device_id}/valves/{valve["name"]}',1) # off // suck
-                        time.sleep(0.8) # modif
+                        self.machine.cancel.sleep(0.8) # modif
                         break
-                    time.sleep(0.02)
+                    self.machine.cancel.sleep(0.02)
                 
             
+            if not self.machine.cancel.cancelled:
+                self.machine.publish_cycle_metrics(self.machine.cycle_metrics.finish())
+
             if i == self.machine.cycle_counter - 1 :
                 for valve in self.machine.valves:
                     self.machine.client.publish(f'{self.machine.device_id}/valves/{valve["name"]}',1) # on // release
         
         
                     
-        if self.machine.test_index_wanted is not None and  not self.machine.force_stop:
+        if self.machine.test_index_wanted is not None and  not self.machine.cancel.cancelled:
             self.machine.store_variables(current_test_index=self.machine.test_index_wanted)
             self.machine.current_test_index = self.machine.test_index_wanted
             self.machine.logger.info(f'Test index wanted: {self.machine.test_index_wanted}')
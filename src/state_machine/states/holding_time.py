@@ -16,17 +16,19 @@ class HoldingTimeState(State):
         self.machine.current_status = 'tuning'
         
         start_time = time.time()
-        while not self.machine.force_stop:
-            if abs(self.machine.sensors_values[self.machine.sensor_id]) > abs(self.machine.setpoint):
+        while not self.machine.cancel.cancelled:
+            # A frozen value must not count as reaching the setpoint
+            fresh = self.machine.wait_for_fresh(self.machine.sensor_id, timeout=0.05)
+            if fresh and abs(self.machine.sensors_values[self.machine.sensor_id]) > abs(self.machine.setpoint):
                 self.machine.logger.info(f"Setpoint reached: {self.machine.sensors_values[self.machine.sensor_id]}")
                 break
             self.freq = self.machine.freq_command
             if time.time() - start_time > 120:  # 2 minutes timeout
                 self.machine.logger.error("Tuning timeout")
                 self.machine.logger.error("Failed to reach setpoint within 2 minutes")
-                self.machine.force_Stop = True
+                self.machine.cancel.cancel()
                 break
-            time.sleep(0.05)
+            self.machine.cancel.sleep(0.05)
 
     def on_exit(self):
         super().on_exit()
@@ -35,12 +37,12 @@ class HoldingTimeState(State):
       
         self.machine.logger.info(f"Starting holding time for {self.machine.holdtime} seconds...")
         i = self.machine.holdtime * 10
-        while i > 0 and not self.machine.force_stop:
+        while i > 0 and not self.machine.cancel.cancelled:
             i = i - 1
-            time.sleep(0.1)
+            self.machine.cancel.sleep(0.1)
             self.machine.current_status = f'Holding {i/10.0}s'
         
-        if self.machine.force_stop:
+        if self.machine.cancel.cancelled:
             self.machine.logger.warning("Holding time interrupted")
         else:
             self.machine.logger.info("Holding time completed.")
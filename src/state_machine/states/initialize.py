@@ -1,4 +1,3 @@
-import time
 from states.state import State
 class InitializeState(State):
         def on_enter(self):
@@ -18,20 +17,20 @@ class InitializeState(State):
 
         def on_exit(self):
             if self.machine.action == 'positive':
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     # if "ACTIVE" in valve['role']:
                         all_matched = all(((not "POSITIVE" in valve['role']) == self.machine.valve_status[valve['name']]) or not "ACTIVE" in valve['role'] for valve in self.machine.valves)
                         if all_matched:
                             break
-                        time.sleep(0.1)
+                        self.machine.cancel.sleep(0.1)
                     
             elif self.machine.action == 'negative':
-                while not self.machine.force_stop:
+                while not self.machine.cancel.cancelled:
                     # if "ACTIVE" in valve['role']:
                         all_matched = all(((not "NEGATIVE" in valve['role']) == self.machine.valve_status[valve['name']]) or not "ACTIVE" in valve['role'] for valve in self.machine.valves)
                         if all_matched:
                             break
-                        time.sleep(0.1)
+                        self.machine.cancel.sleep(0.1)
                         
             self.machine.current_status = 'valves configuration approved'
             
\ No newline at end of file
@@ -1,5 +1,4 @@
 from states.state import State
-import time
 
 
 class ReliefValvesState(State):
@@ -13,10 +12,10 @@ class ReliefValvesState(State):
         
     def on_exit(self):
         super().on_exit()
-        while not self.machine.force_stop:
+        while not self.machine.cancel.cancelled:
             all_matched = all(self.machine.valve_status)
             if all_matched:
                 break
-            time.sleep(0.1)
+            self.machine.cancel.sleep(0.1)
         self.machine.current_status = 'valves configured'
         
\ No newline at end of file
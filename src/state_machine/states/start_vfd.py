@@ -32,18 +32,18 @@ class StartVDFState(State):
             self.machine.current_status = 'vfd reset'
         except Exception as e:
             self.machine.logger.error(f"Error starting VDF: {str(e)}")
-            self.machine.force_Stop = True
+            self.machine.cancel.cancel()
         
     def on_exit(self):
         super().on_exit()
         self.machine.logger.info("Waiting for VDF to start...")
         start_time = time.time()
-        while not self.machine.force_stop:
+        while not self.machine.cancel.cancelled:
             if self.machine.vdf_feedback == 0:
                 self.machine.logger.info("VDF feedback is 0, VDF initialized successfully.")
                 break
             if time.time() - start_time > 90:  # 90 seconds timeout
                 self.machine.logger.error("VDF start timeout")
                 raise TimeoutError("VDF failed to start within 30 seconds")
-            time.sleep(0.1)
+            self.machine.cancel.sleep(0.1)
         self.machine.current_status = 'vfd started'
\ No newline at end of file
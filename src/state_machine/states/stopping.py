@@ -9,7 +9,7 @@ class StoppingState(State):
 
         def on_exit(self):
             super().on_exit()
-            if(self.machine.force_stop): self.machine.current_status = 'emergency: waiting for vdf to stop'
+            if(self.machine.cancel.cancelled): self.machine.current_status = 'emergency: waiting for vdf to stop'
             while not self.machine.exit:
                 if self.machine.vdf_feedback == 0:
                     break
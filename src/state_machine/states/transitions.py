@@ -0,0 +1,69 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+# An event names a command, the payload is the original command message shared read-only by
+# every follow-up event of the same run, never copied
+Event = namedtuple('Event', 'command payload')
+
+# action: StateMachine method called with the event before leaving the current state
+# follow_up: command posted once the next state is entered, or a function of the machine returning it
+Transition = namedtuple('Transition', 'state command next_state follow_up action')
+
+
+def make_event(command, payload=None) -> Event:
+    return Event(command, MappingProxyType(dict(payload or {})))
+
+
+def run_mode(machine):
+    """hold for a manual test, automatic for a cyclic one"""
+    return 'automatic' if machine.cyclic_mode else 'hold'
+
+
+TRANSITIONS = [
+    Transition('idle', 'start', 'initializing_valves', 'turn_on', 'configure_test'),
+    Transition('initializing_valves', 'turn_on', 'start_vdf', run_mode, None),
+    Transition('start_vdf', 'hold', 'holding_time', 'relief', None),
+    Transition('start_vdf', 'automatic', 'automatic_cycling', 'relief', None),
+    Transition('holding_time', 'relief', 'relief', 'turn_off', None),
+    Transition('automatic_cycling', 'relief', 'relief', 'turn_off', None),
+    Transition('relief', 'turn_off', 'stopping', 'idle', None),
+    Transition('stopping', 'idle', 'idle', None, 'end_test'),
+]
+
+# After a failed transition the machine is forced down this path, valves relieved, VFD
+# stopped, then idle, starting past the failed state: (state, command posted on entering it)
+RECOVERY = [
+    ('relief', 'turn_off'),
+    ('stopping', 'idle'),
+    ('idle', None),
+]
+
+
+class TransitionTable:
+    """(state, command) -> Transition, compiled once into a dict."""
+
+    def __init__(self, transitions=TRANSITIONS):
+        self.transitions = list(transitions)
+        self.table = {}
+        for transition in self.transitions:
+            key = (transition.state, transition.command)
+            if key in self.table:
+                raise ValueError(f"Duplicate transition for command {transition.command} in state {transition.state}")
+            self.table[key] = transition
+
+    def lookup(self, state, command):
+        return self.table.get((state, command))
+
+    def to_dot(self) -> str:
+        """The state graph in Graphviz DOT, edges labelled command / follow-up."""
+        lines = ['digraph state_machine {', '    rankdir=LR;']
+        for t in self.transitions:
+            follow_up = f'{t.follow_up.__name__}()' if callable(t.follow_up) else t.follow_up
+            label = t.command if follow_up is None else f'{t.command} / {follow_up}'
+            lines.append(f'    "{t.state}" -> "{t.next_state}" [label="{label}"];')
+        lines.append('}')
+        return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    print(TransitionTable().to_dot())
@@ -0,0 +1,159 @@
+"""
+Payload encoding of the high-rate telemetry topics (sensor values, sensor frames, VFD
+feedback and valve status). Each service ships its own copy of this module, the copies
+in serial_service, valves_node and state_machine must stay identical.
+
+With telemetry.encoding "json" payloads are plain ASCII numbers and JSON, readable with any
+MQTT client for debugging. With "binary" they are struct-packed behind a 3-byte header
+(magic, version, kind). Decoders accept both, so the encodings can be switched per service.
+"""
+import json
+import struct
+
+MAGIC = 0xB5  # not a valid first byte of an ASCII number or of JSON
+VERSION = 3
+
+VALUE = 1
+FRAME = 2
+VALVES = 3
+READING = 4
+
+# Quality of a sensor reading
+GOOD = 0  # read from the sensor
+STALE = 1  # the last read failed, the value is the last good one
+FAILED = 2  # the sensor is unavailable, the value is the last good one
+ESTIMATED = 3  # read from the sensor but derived from assumed inputs
+QUALITY_NAMES = {GOOD: "good", STALE: "stale", FAILED: "failed", ESTIMATED: "estimated"}
+
+HEADER = struct.Struct("<BBB")
+VALUE_BODY = struct.Struct("<f")
+READING_BODY = struct.Struct("<fBf")  # value, quality, age in seconds
+FRAME_BODY = struct.Struct("<IdB")  # sequence, capture time of the oldest reading, channel count
+FRAME_CHANNEL = struct.Struct("<HfBfd")  # sensor address, value, quality, age, capture time
+VALVES_BODY = struct.Struct("<BI")  # valve count, state bits in config order
+
+
+class TelemetryDecodeError(ValueError):
+    pass
+
+
+def is_binary(payload: bytes) -> bool:
+    return len(payload) >= HEADER.size and payload[0] == MAGIC
+
+
+def _header(payload: bytes, kind: int) -> int:
+    magic, version, payload_kind = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise TelemetryDecodeError(f"Unsupported telemetry version {version}")
+    if payload_kind != kind:
+        raise TelemetryDecodeError(f"Expected telemetry kind {kind}, got {payload_kind}")
+    return HEADER.size
+
+
+def encode_value(value: float, binary: bool = False):
+    if not binary:
+        return value
+    return HEADER.pack(MAGIC, VERSION, VALUE) + VALUE_BODY.pack(value)
+
+
+def decode_value(payload: bytes) -> float:
+    if not is_binary(payload):
+        return float(payload.decode())
+    return VALUE_BODY.unpack_from(payload, _header(payload, VALUE))[0]
+
+
+def encode_reading(value: float, quality: int = GOOD, age: float = 0.0, binary: bool = False):
+    """
+    A sensor reading with its quality and the age of the value in seconds. As JSON the value
+    topic always carries a plain number, so subscribers parsing it as a float keep working;
+    quality and age then go on the sibling {topic}/quality topic, see encode_quality.
+    """
+    if not binary:
+        return value
+    return HEADER.pack(MAGIC, VERSION, READING) + READING_BODY.pack(value, quality, age)
+
+
+def decode_reading(payload: bytes):
+    """Returns (value, quality, age), a plain number is a good reading of age 0."""
+    if is_binary(payload):
+        return READING_BODY.unpack_from(payload, _header(payload, READING))
+    return float(payload.decode()), GOOD, 0.0
+
+
+def encode_quality(quality: int, age: float) -> str:
+    """Payload of {device_id}/sensors/<address>/quality: {"q": quality, "age": age}."""
+    return json.dumps({"q": quality, "age": round(age, 3)})
+
+
+def decode_quality(payload: bytes):
+    """Returns (quality, age)."""
+    reading = json.loads(payload)
+    return int(reading["q"]), float(reading["age"])
+
+
+def encode_frame(seq: int, readings: dict, binary: bool = False):
+    """
+    A frame holds at most one reading per sensor, t is the capture time of its oldest reading.
+
+    :param readings: {sensor address: (value, quality, age, capture time)}, times from time.time()
+    """
+    t = min(reading[3] for reading in readings.values()) if readings else 0.0
+    if not binary:
+        return json.dumps({
+            "seq": seq,
+            "t": t,
+            "values": {address: reading[0] for address, reading in readings.items()},
+            "quality": {address: reading[1] for address, reading in readings.items()},
+            "age": {address: round(reading[2], 3) for address, reading in readings.items()},
+            "time": {address: reading[3] for address, reading in readings.items()},
+        })
+    parts = [HEADER.pack(MAGIC, VERSION, FRAME), FRAME_BODY.pack(seq, t, len(readings))]
+    for address, (value, quality, age, captured) in readings.items():
+        parts.append(FRAME_CHANNEL.pack(int(address), value, quality, age, captured))
+    return b"".join(parts)
+
+
+def decode_frame(payload: bytes) -> dict:
+    """
+    Returns {"seq": n, "t": capture time of the oldest reading, "values": {address: value},
+    "quality": {address: quality}, "age": {address: age}, "time": {address: capture time}},
+    addresses as str.
+    """
+    if not is_binary(payload):
+        frame = json.loads(payload)
+        frame.setdefault("quality", {address: GOOD for address in frame["values"]})
+        frame.setdefault("age", {address: 0.0 for address in frame["values"]})
+        frame.setdefault("time", {address: frame["t"] for address in frame["values"]})
+        return frame
+    offset = _header(payload, FRAME)
+    seq, t, count = FRAME_BODY.unpack_from(payload, offset)
+    offset += FRAME_BODY.size
+    values, quality, age, captured = {}, {}, {}, {}
+    for address, value, q, a, c in FRAME_CHANNEL.iter_unpack(payload[offset:offset + count * FRAME_CHANNEL.size]):
+        address = str(address)
+        values[address] = value
+        quality[address] = q
+        age[address] = a
+        captured[address] = c
+    return {"seq": seq, "t": t, "values": values, "quality": quality, "age": age, "time": captured}
+
+
+def encode_valves(states: dict, names: list, binary: bool = False):
+    """
+    :param states: {valve name: 0/1}
+    :param names: Valve names in config order, which fixes the bit of each valve.
+    """
+    if not binary:
+        return json.dumps(states)
+    bits = 0
+    for i, name in enumerate(names):
+        if states.get(name):
+            bits |= 1 << i
+    return HEADER.pack(MAGIC, VERSION, VALVES) + VALVES_BODY.pack(len(names), bits)
+
+
+def decode_valves(payload: bytes, names: list) -> dict:
+    if not is_binary(payload):
+        return {name: int(state) for name, state in json.loads(payload).items()}
+    count, bits = VALVES_BODY.unpack_from(payload, _header(payload, VALVES))
+    return {name: (bits >> i) & 1 for i, name in enumerate(names[:count])}
@@ -12,6 +12,7 @@ from logging.handlers import RotatingFileHandler
 import time
 import os
 import paho.mqtt.client as mqtt
+from telemetry_codec import encode_valves
 from logging.handlers import RotatingFileHandler
 
 class ValveController:
@@ -27,6 +28,7 @@ class ValveController:
 
         self.valves = config.get('valves', [])
         self.device_id = config.get('device_id')
+        self.binary = config.get('telemetry', {}).get('encoding', 'json') == 'binary'
         mqtt_config = config.get('mqtt', {})
         self.broker_host = mqtt_config.get('broker_host')
         self.broker_port = mqtt_config.get('broker_port')
@@ -107,7 +109,8 @@ class ValveController:
         self.connect_mqtt()
         while True:
             try:
-                self.client.publish(f'{self.device_id}/valves/status', json.dumps({v['name']: GPIO.input(v['pin']) for v in self.valves}))
+                states = {v['name']: GPIO.input(v['pin']) for v in self.valves}
+                self.client.publish(f'{self.device_id}/valves/status', encode_valves(states, [v['name'] for v in self.valves], self.binary))
                 time.sleep(0.2)  # Keep the script running to handle MQTT messages
             except Exception as e:
                 self.logger.error(f"Error during run loop: {e}", exc_info=True)
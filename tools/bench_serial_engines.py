@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "serial_service"))
+import paho.mqtt.client as mqtt
+from slave_farm import Faults, SlaveFarm, slaves_from_config
+from serial_com.serial_com import SerialCom
+from serial_com.scheduler import Priority
+from sensors_handler.sensor_node import SensorHandler
+from vfd_handler.vfd_node import VFDController
+from async_engine.engine import AsyncSerialService
+
+VFD_ADDRESS = 5
+FLOW_ADDRESS = 11
+
+# name: (response delay, Faults arguments, dead slave addresses)
+SCENARIOS = {
+    "nominal": (0.0, {}, ()),
+    "slow_slaves": (0.01, {}, ()),
+    "faulty_bus": (0.0, {"drop_rate": 0.02, "corrupt_rate": 0.02, "exception_rate": 0.01}, ()),
+    "dead_flow_meter": (0.0, {}, (FLOW_ADDRESS,)),
+}
+
+
+def run_farm(conn, config, scenario):
+    delay, faults, dead = SCENARIOS[scenario]
+    farm = SlaveFarm(slaves_from_config(config, delay, Faults(**faults), dead), seed=1)
+    farm.start()
+    conn.send(farm.port)
+    conn.recv()
+    farm.stop()
+
+
+def make_config(sensors, frequency, baudrate):
+    sensor_configs = [
+        {"name": str(a), "address": str(a), "debug": False, "frequency": frequency, "active": True, "type": "pressure"}
+        for a in range(1, sensors + 1)
+    ]
+    sensor_configs.append({
+        "name": "Flow", "address": str(FLOW_ADDRESS), "debug": False, "frequency": 20, "active": True, "type": "flow",
+        "pressure_sensor_device_id": "bench", "pressure_sensor_address": 1,
+    })
+    return {
+        "device_id": "bench",
+        "serial": {
+            "port": None,
+            "baudrate": baudrate,
+            "bytesize": 8,
+            "parity": "PARITY_NONE",
+            "stopbits": 1,
+            "timeout": 0.05,
+            "mode": "MODE_RTU",
+            "clear_buffers_before_each_transaction": True,
+            "close_port_after_each_call": False,
+        },
+        "mqtt": {"broker_host": "localhost", "broker_port": 1883, "username": "", "password": ""},
+        "sensors": sensor_configs,
+        "vfd": {"name": "vfd", "address": str(VFD_ADDRESS), "debug": False},
+    }
+
+
+class OfflineSensorHandler(SensorHandler):
+    """SensorHandler with an unconnected MQTT client, publishing goes nowhere."""
+
+    def connect_mqtt_broker(self):
+        self.mqtt_connected = True
+
+
+class OfflineVFDController(VFDController):
+    def setup_mqtt(self):
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+
+
+class OfflineAsyncSerialService(AsyncSerialService):
+    async def connect_mqtt(self):
+        self.mqtt_connected = True
+
+
+class Result:
+    def __init__(self, duration):
+        self.duration = duration
+        self.reads = {}
+        self.control = []
+        self.transactions = 0
+        self.cpu = 0.0
+
+    def row(self, scenario, engine):
+        # Sensors poll at different rates, so jitter is the spread of each sensor's own intervals, averaged
+        spreads = []
+        for times in self.reads.values():
+            intervals = [b - a for a, b in zip(times, times[1:])]
+            if len(intervals) > 1:
+                spreads.append(statistics.pstdev(intervals))
+        jitter = statistics.mean(spreads) * 1000 if spreads else 0.0
+        control_mean = statistics.mean(self.control) * 1000 if self.control else 0.0
+        control_max = max(self.control) * 1000 if self.control else 0.0
+        return (
+            f"{scenario:>16} {engine:>9} {self.transactions / self.duration:9.1f} {self.cpu / self.duration * 100:6.1f} "
+            f"{jitter:10.2f} {control_mean:9.2f} {control_max:9.2f}"
+        )
+
+
+HEADER = f"{'scenario':>16} {'engine':>9} {'trans/s':>9} {'CPU%':>6} {'jitter ms':>10} {'ctl ms':>9} {'ctl max':>9}"
+
+
+def bench_threaded(config_file, duration, control_period):
+    result = Result(duration)
+    serial_com = SerialCom(config_file)
+    handler = OfflineSensorHandler(config_file, serial_com)
+    vfd = OfflineVFDController(config_file, serial_com)
+    result.reads = {sensor.address: [] for sensor in handler.sensors}
+    read_map = serial_com.read_map
+
+    def timed_read_map(address, *args, **kwargs):
+        result.reads[address].append(time.monotonic())
+        return read_map(address, *args, **kwargs)
+
+    serial_com.read_map = timed_read_map
+    running = True
+
+    def feedback():
+        while running:
+            try:
+                serial_com.read_register(VFD_ADDRESS, vfd.readFreqAddr, 2, vfd.readFC, priority=Priority.VFD_FEEDBACK)
+            except Exception:
+                pass
+            time.sleep(1)
+
+    def control():
+        frequency = 0
+        while running:
+            frequency = (frequency + 5) % 50
+            start = time.monotonic()
+            vfd.set_frequency(frequency)
+            result.control.append(time.monotonic() - start)
+            time.sleep(control_period)
+
+    threads = [threading.Thread(target=target) for target in (handler.run, feedback, control)]
+    cpu = time.process_time()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    handler.running = False
+    running = False
+    for thread in threads:
+        thread.join()
+    result.cpu = time.process_time() - cpu
+    result.transactions = serial_com.session.transactions
+    serial_com.close()
+    return result
+
+
+def bench_asyncio(config_file, duration, control_period):
+    result = Result(duration)
+    service = OfflineAsyncSerialService(config_file)
+    result.reads = {sensor.address: [] for sensor in service.sensors}
+
+    def timed(read_map):
+        async def timed_read_map(address, *args, **kwargs):
+            result.reads[address].append(time.monotonic())
+            return await read_map(address, *args, **kwargs)
+        return timed_read_map
+
+    for modbus in service.buses.values():
+        modbus.read_map = timed(modbus.read_map)
+
+    async def control():
+        frequency = 0
+        while True:
+            frequency = (frequency + 5) % 50
+            start = time.monotonic()
+            await service.handle_vfd_command("set_frequency", frequency)
+            result.control.append(time.monotonic() - start)
+            await asyncio.sleep(control_period)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        tasks = [loop.create_task(service.run())]
+        await asyncio.sleep(0.01)
+        tasks.append(loop.create_task(control()))
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    cpu = time.process_time()
+    asyncio.run(main())
+    result.cpu = time.process_time() - cpu
+    result.transactions = sum(modbus.transactions for modbus in service.buses.values())
+    return result
+
+
+def run_scenario(scenario, engines, args, workdir):
+    config = make_config(args.sensors, args.frequency, args.baudrate)
+    parent, child = multiprocessing.Pipe()
+    farm = multiprocessing.Process(target=run_farm, args=(child, config, scenario))
+    farm.start()
+    config["serial"]["port"] = parent.recv()
+    config_file = os.path.join(workdir, f"{scenario}.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    try:
+        for engine in engines:
+            bench = bench_threaded if engine == "threaded" else bench_asyncio
+            print(bench(config_file, args.duration, args.control_period).row(scenario, engine), flush=True)
+    finally:
+        parent.send("stop")
+        farm.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial_service against emulated slaves on a pseudo-terminal")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), nargs="*", default=list(SCENARIOS), help="Scenarios to run")
+    parser.add_argument("--engine", choices=["threaded", "asyncio"], nargs="*", default=["threaded", "asyncio"], help="Engines to run")
+    parser.add_argument("--sensors", type=int, default=3, help="Number of pressure sensors")
+    parser.add_argument("--frequency", type=float, default=50, help="Polling frequency per pressure sensor in Hz")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per engine and scenario")
+    parser.add_argument("--control-period", type=float, default=0.25, help="Seconds between VFD set_frequency writes")
+    parser.add_argument("--baudrate", type=int, default=9600, help="Baudrate used for RTU frame spacing")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(HEADER)
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        for scenario in args.scenario:
+            run_scenario(scenario, args.engine, args, workdir)
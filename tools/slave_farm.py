@@ -0,0 +1,254 @@
+import os
+import sys
+import tty
+import json
+import time
+import struct
+import random
+import select
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "serial_service"))
+from async_engine import rtu
+
+
+class Faults:
+    """Per-request fault injection probabilities, all 0 by default."""
+
+    def __init__(self, drop_rate: float = 0.0, corrupt_rate: float = 0.0, exception_rate: float = 0.0):
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.exception_rate = exception_rate
+
+
+class RegisterSlave:
+    """A slave backed by a plain register table."""
+
+    def __init__(self, registers: dict = None, response_delay: float = 0.0, faults: Faults = None):
+        self.registers = dict(registers or {})
+        self.response_delay = response_delay
+        self.faults = faults or Faults()
+        self.alive = True
+
+    def read(self, register: int) -> int:
+        return self.registers.get(register, 0)
+
+    def write(self, register: int, value: int):
+        self.registers[register] = value
+
+
+class VFDSlave(RegisterSlave):
+    """
+    The VFD as serial_service sees it: 8192 start (18) / stop (1), 8193 frequency setpoint
+    and 8451 output frequency, both in 0.01 Hz, ramping at ramp_rate Hz/s.
+    """
+
+    START_STOP = 8192
+    SET_FREQUENCY = 8193
+    READ_FREQUENCY = 8451
+
+    def __init__(self, ramp_rate: float = 10.0, **kwargs):
+        super().__init__(**kwargs)
+        self.ramp_rate = ramp_rate
+        self.running = False
+        self.setpoint = 0.0
+        self.frequency = 0.0
+        self.updated = time.monotonic()
+
+    def update(self):
+        now = time.monotonic()
+        step = self.ramp_rate * (now - self.updated)
+        self.updated = now
+        target = self.setpoint if self.running else 0.0
+        if self.frequency < target:
+            self.frequency = min(self.frequency + step, target)
+        else:
+            self.frequency = max(self.frequency - step, target)
+
+    def read(self, register: int) -> int:
+        self.update()
+        if register == self.READ_FREQUENCY:
+            return int(round(self.frequency * 100))
+        if register == self.SET_FREQUENCY:
+            return int(round(self.setpoint * 100))
+        return super().read(register)
+
+    def write(self, register: int, value: int):
+        self.update()
+        if register == self.START_STOP:
+            self.running = value == 18
+        elif register == self.SET_FREQUENCY:
+            self.setpoint = value / 100
+        super().write(register, value)
+
+
+class PressureSensorSlave(RegisterSlave):
+    """Float pressure at register 1028, proportional to the VFD output frequency plus noise."""
+
+    REGISTER = 1028
+
+    def __init__(self, vfd: VFDSlave = None, gain: float = -0.005, noise: float = 0.0005, **kwargs):
+        super().__init__(**kwargs)
+        self.vfd = vfd
+        self.gain = gain
+        self.noise = noise
+
+    def read(self, register: int) -> int:
+        if register in (self.REGISTER, self.REGISTER + 1):
+            if self.vfd is not None:
+                self.vfd.update()
+            frequency = self.vfd.frequency if self.vfd is not None else 0.0
+            value = self.gain * frequency + random.uniform(-self.noise, self.noise)
+            words = struct.unpack(">HH", struct.pack(">f", value))
+            return words[register - self.REGISTER]
+        return super().read(register)
+
+
+class FlowMeterSlave(RegisterSlave):
+    """Differential pressure at 0x0424 as a 32-bit unsigned value in 1/10000 Pa."""
+
+    REGISTER = 0x0424
+
+    def __init__(self, vfd: VFDSlave = None, gain: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.vfd = vfd
+        self.gain = gain
+
+    def read(self, register: int) -> int:
+        if register in (self.REGISTER, self.REGISTER + 1):
+            frequency = self.vfd.frequency if self.vfd is not None else 0.0
+            raw = int(self.gain * frequency * 10000) & 0xFFFFFFFF
+            words = struct.unpack(">HH", struct.pack(">I", raw))
+            return words[register - self.REGISTER]
+        return super().read(register)
+
+
+class SlaveFarm:
+    """
+    Serves several emulated slaves on one pseudo-terminal, answering Modbus RTU function
+    codes 3, 4, 6 and 16 with each slave's response delay and injected faults.
+    """
+
+    def __init__(self, slaves: dict, seed: int = None):
+        # slaves: {slave address: RegisterSlave}
+        self.slaves = slaves
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.running = False
+        self.thread = None
+        self.requests = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def serve(self):
+        buffer = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if not ready:
+                buffer = b""
+                continue
+            buffer += os.read(self.master, 256)
+            length = self.request_length(buffer)
+            if length and len(buffer) >= length:
+                request, buffer = buffer[:length], buffer[length:]
+                self.requests += 1
+                response = self.respond(request)
+                if response:
+                    os.write(self.master, response)
+
+    @staticmethod
+    def request_length(buffer: bytes) -> int:
+        if len(buffer) < 2:
+            return 0
+        if buffer[1] == 16:
+            return 9 + buffer[6] if len(buffer) >= 7 else 0
+        return 8
+
+    def respond(self, request: bytes):
+        if struct.unpack("<H", request[-2:])[0] != rtu.crc16(request[:-2]):
+            return None
+        address, functioncode = request[0], request[1]
+        device = self.slaves.get(address)
+        if device is None or not device.alive:
+            return None
+        faults = device.faults
+        if self.random.random() < faults.drop_rate:
+            return None
+        if device.response_delay:
+            time.sleep(device.response_delay)
+        if self.random.random() < faults.exception_rate:
+            return rtu.frame(address, functioncode | 0x80, bytes([6]))  # slave device busy
+        response = self.answer(device, request)
+        if self.random.random() < faults.corrupt_rate:
+            response = response[:-1] + bytes([response[-1] ^ 0xFF])
+        return response
+
+    @staticmethod
+    def answer(device: RegisterSlave, request: bytes) -> bytes:
+        address, functioncode = request[0], request[1]
+        register, value = struct.unpack(">HH", request[2:6])
+        if functioncode in (3, 4):
+            values = [device.read(register + i) for i in range(value)]
+            return rtu.frame(address, functioncode, bytes([2 * value]) + struct.pack(f">{value}H", *values))
+        if functioncode == 6:
+            device.write(register, value)
+            return rtu.frame(address, functioncode, request[2:6])
+        if functioncode == 16:
+            for i, word in enumerate(struct.unpack(f">{value}H", request[7:-2])):
+                device.write(register + i, word)
+            return rtu.frame(address, functioncode, request[2:6])
+        return rtu.frame(address, functioncode | 0x80, bytes([1]))  # illegal function
+
+
+def slaves_from_config(config: dict, response_delay: float = 0.0, faults: Faults = None, dead=()):
+    """
+    Builds the slaves described by a serial_service config.json: the VFD and every sensor,
+    active or not. Addresses listed in dead are created but never answer.
+    """
+    vfd_address = int(config["vfd"]["address"])
+    vfd = VFDSlave(response_delay=response_delay, faults=faults)
+    slaves = {vfd_address: vfd}
+    for sensor in config["sensors"]:
+        address = int(sensor["address"])
+        if sensor["type"] == "pressure":
+            slaves[address] = PressureSensorSlave(vfd, response_delay=response_delay, faults=faults)
+        elif sensor["type"] == "flow":
+            slaves[address] = FlowMeterSlave(vfd, response_delay=response_delay, faults=faults)
+    for address in dead:
+        if address in slaves:
+            slaves[address].alive = False
+    return slaves
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate the rig's Modbus slaves on a pseudo-terminal")
+    parser.add_argument("config", help="serial_service config.json describing the sensors and VFD")
+    parser.add_argument("--delay", type=float, default=0.0, help="Response delay in seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Probability of not answering a request")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="Probability of a bad CRC in the answer")
+    parser.add_argument("--exception-rate", type=float, default=0.0, help="Probability of a slave busy exception")
+    parser.add_argument("--dead", type=int, nargs="*", default=[], help="Slave addresses that never answer")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        config = json.load(f)
+    faults = Faults(args.drop_rate, args.corrupt_rate, args.exception_rate)
+    farm = SlaveFarm(slaves_from_config(config, args.delay, faults, args.dead))
+    farm.start()
+    print(f"Serving {sorted(farm.slaves)} on {farm.port}", flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        farm.stop()